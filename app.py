@@ -1,11 +1,95 @@
 import flask
 from flask import request, jsonify
 from flask_login import current_user
+import atexit
+import logging
+import os
+import threading
+import time
 import tools.orm as orm
+from tools import metrics
+from tools.algo import Algorithm
+from tools.deck import MatchDeck
+from tools.seen import SeenFilter
+from tools.shards import ShardedMatcher
+from tools.swipes import SwipeWriter
+
+logger = logging.getLogger(__name__)
 
 app = flask.Flask(__name__)
 
 app.db = orm.Database("schooltinder.db")
+app.db.migrate()
+
+# Read-through cache for User lookups (0 disables it). Processes serving the
+# same database can share invalidations through a file named by
+# SCHOOLTINDER_USER_CACHE_NOTIFY; otherwise their entries expire after 5 minutes.
+USER_CACHE_SIZE = int(os.environ.get("SCHOOLTINDER_USER_CACHE", "10000"))
+if USER_CACHE_SIZE > 0:
+    orm.User.enable_cache(
+        app.db.path, USER_CACHE_SIZE, ttl=300.0, notify_path=os.environ.get("SCHOOLTINDER_USER_CACHE_NOTIFY")
+    )
+
+
+def on_mutual_match(profile_id: int, other_profile_id: int) -> None:
+    logger.info("Mutual match between %s and %s", profile_id, other_profile_id)
+
+
+# Swipes are queued and written in batches by a background thread
+app.swipes = SwipeWriter(app.db.path, on_match=on_mutual_match)
+# Already swiped profiles per user, so GET /match never shows them again
+app.seen = SeenFilter(app.db.path, writer=app.swipes)
+
+MATCHER_SNAPSHOT = "matcher.snapshot"
+# More than one: the matcher index is split across this many worker processes
+MATCHER_SHARDS = int(os.environ.get("SCHOOLTINDER_MATCHER_SHARDS", "1"))
+_deck = None
+_deck_lock = threading.Lock()
+
+
+def get_deck() -> MatchDeck:
+    """
+    Per-user decks of ranked matches, refilled in the background. The matcher
+    behind them is built on first use (from the snapshot if it is usable).
+    """
+    global _deck
+    with _deck_lock:
+        if _deck is None:
+            if MATCHER_SHARDS > 1:
+                matcher = ShardedMatcher(app.db, MATCHER_SHARDS, snapshot_path=MATCHER_SNAPSHOT, seen=app.seen)
+            else:
+                matcher = Algorithm(app.db, snapshot_path=MATCHER_SNAPSHOT, seen=app.seen)
+            # Profile writes from any process reach the index through the change log
+            matcher.start_sync()
+            atexit.register(matcher.close)
+            _deck = MatchDeck(matcher)
+        return _deck
+
+
+# TODO: Implement user login and management, then use current_user.profile_id
+DEV_PROFILE_ID = 1
+
+
+def current_profile_id() -> int:
+    return DEV_PROFILE_ID
+
+if metrics.enabled:
+    @app.before_request
+    def start_request_timer():
+        flask.g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        started = flask.g.get("request_started")
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.HTTP_DURATION.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+        return response
+
+@app.route("/metrics")
+def get_metrics():
+    # Prometheus text format; set SCHOOLTINDER_METRICS=1 to collect anything
+    return flask.Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/")
 def index():
@@ -15,36 +99,108 @@ def index():
 def tinder():
     return flask.render_template("tinder-test.html", name="Flinn")
 
-@app.route("/match", methods=["GET"])
-def get_next_match():
-    match = {
-        "pictures": [
-            "url1",
-            "url2",
-            "url3",
-        ],
-        "name": "Marc",
-        "link_to_profile": "url_to_profile",
+# Upper bounds for one GET /match?count=N and one POST /match/batch
+MAX_CARDS_PER_REQUEST = 50
+MAX_SWIPES_PER_BATCH = 500
+
+
+def profile_card(match) -> dict:
+    return {
+        "profileId": match.profile_id,
+        "pictures": [picture.path for picture in match.pictures],
+        "name": match.profile.first_name,
+        "link_to_profile": f"/profile/{match.profile_id}",
         # TODO: Alle Daten die angezeigt werden sollen.
     }
-    return jsonify(match)
+
+
+def parse_swipe(data, profile_id: int) -> tuple[int, str]:
+    """(otherProfileId, result) of one swipe by profile_id; raises ValueError if invalid"""
+    if not isinstance(data, dict):
+        raise ValueError("Invalid swipe")
+    result: str = str(data.get("result"))
+    try:
+        otherProfileId: int = int(data.get("otherProfileId"))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid otherProfileId")
+    if otherProfileId < 1 or otherProfileId == profile_id:
+        raise ValueError("Invalid otherProfileId")
+    if result not in ["success", "denial"]:
+        raise ValueError("Invalid result")
+    return otherProfileId, result
+
+
+def check_swipe_targets(swipes: list[tuple[int, str]]) -> None:
+    """Raises ValueError if a swiped profile does not exist (one query per call)"""
+    existing = app.db.existing_profile_ids(otherProfileId for otherProfileId, _ in swipes)
+    for otherProfileId, _ in swipes:
+        if otherProfileId not in existing:
+            raise ValueError(f"Unknown otherProfileId: {otherProfileId}")
+
+
+def record_swipe(profile_id: int, otherProfileId: int, result: str) -> None:
+    # Queued only - the swipe is written to the database in the background
+    app.swipes.submit(profile_id, otherProfileId, result)
+    app.seen.mark(profile_id, otherProfileId)
+
+
+@app.route("/match", methods=["GET"])
+def get_next_match():
+    profile_id: int = current_profile_id()
+
+    if "count" not in request.args:
+        other_profile_id = get_deck().next(profile_id)
+        match = app.db.get_profile(other_profile_id) if other_profile_id is not None else None
+        if match is None:
+            return jsonify({"error": "No more matches"}), 404
+        return jsonify(profile_card(match))
+
+    try:
+        count = int(request.args["count"])
+    except ValueError:
+        return jsonify({"error": "Invalid count"}), 400
+    if count < 1:
+        return jsonify({"error": "Invalid count"}), 400
+    # All cards of the batch are loaded with one set of queries
+    other_profile_ids = get_deck().take(profile_id, min(count, MAX_CARDS_PER_REQUEST))
+    return jsonify({"matches": [profile_card(match) for match in app.db.get_profiles(other_profile_ids)]})
 
 @app.route("/match", methods=["POST"])
 def update_match():
     data = request.get_json()
     
-    # profile_id: str = current_user.profileId TODO: Implement user login and management
-    profile_id: str = "dajkdanwhjkdnijd2i3j1jkn"
-    otherProfileId: str = str(data.get("otherProfileId"))
-    result: str = str(data.get("result"))
-    
-    
-    if result not in ["success", "denial"]:
-        return jsonify({"error": "Invalid result"}), 400
+    profile_id: int = current_profile_id()
+    try:
+        otherProfileId, result = parse_swipe(data, profile_id)
+        check_swipe_targets([(otherProfileId, result)])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    print(f"Match {profile_id}(You) matched with -> {otherProfileId}(From your profile) updated as {result}")
+    record_swipe(profile_id, otherProfileId, result)
     
     return jsonify({"message": f"Match {profile_id}-{otherProfileId} updated successfully", "result": result})
 
+@app.route("/match/batch", methods=["POST"])
+def update_matches():
+    # force: swipes sent with navigator.sendBeacon while the page unloads
+    data = request.get_json(force=True, silent=True)
+
+    profile_id: int = current_profile_id()
+    if not isinstance(data, list):
+        return jsonify({"error": "Expected a list of swipes"}), 400
+    if len(data) > MAX_SWIPES_PER_BATCH:
+        return jsonify({"error": f"At most {MAX_SWIPES_PER_BATCH} swipes per batch"}), 400
+    # Validate everything first, so a batch is recorded completely or not at all
+    try:
+        swipes = [parse_swipe(item, profile_id) for item in data]
+        check_swipe_targets(swipes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    for otherProfileId, result in swipes:
+        record_swipe(profile_id, otherProfileId, result)
+
+    return jsonify({"message": f"{len(swipes)} matches of {profile_id} updated successfully", "count": len(swipes)})
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,211 @@
+"""
+Async serving mode for the match endpoints.
+
+    uv sync --extra async
+    python asgi.py
+
+Shares the database, swipe writer, seen filter and match decks of app.py.
+Requests are handled on one event loop; blocking work (SQLite, ranking) runs
+on a small thread pool sized like the connection pool. When too much work is
+waiting the server answers 503 instead of queueing without bound, and work
+that takes longer than REQUEST_TIMEOUT is answered with 504.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import flask
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import app as flask_app
+from tools import metrics
+
+# Blocking jobs allowed to wait for or run on the executor at the same time
+MAX_PENDING = 256
+# Seconds until a request is answered with 504
+REQUEST_TIMEOUT = 5.0
+
+
+class Overloaded(Exception):
+    pass
+
+
+class BlockingPool:
+    """Bounded thread pool for blocking calls from async code"""
+
+    def __init__(self, workers: int, max_pending: int, timeout: float) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asgi-blocking")
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) on the pool; raises Overloaded or asyncio.TimeoutError"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise Overloaded()
+            self.pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        # A job keeps its slot until it really finished, even after a timeout
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+
+# One worker per pooled connection, so workers never wait for a connection
+blocking = BlockingPool(flask_app.app.db.pool.size, MAX_PENDING, REQUEST_TIMEOUT)
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    try:
+        return await blocking.run(fn, *args)
+    except Overloaded:
+        return JSONResponse({"error": "Server busy"}, status_code=503, headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        return JSONResponse({"error": "Request timed out"}, status_code=504)
+
+
+def render(template: str, **context: Any) -> str:
+    with flask_app.app.test_request_context():
+        return flask.render_template(template, **context)
+
+
+def next_matches(profile_id: int, count: int) -> list[dict]:
+    other_profile_ids = flask_app.get_deck().take(profile_id, count)
+    return [flask_app.profile_card(match) for match in flask_app.app.db.get_profiles(other_profile_ids)]
+
+
+def record_swipes(profile_id: int, swipes: list[tuple[int, str]]) -> None:
+    """Raises ValueError, before recording anything, if a swiped profile does not exist"""
+    flask_app.check_swipe_targets(swipes)
+    for otherProfileId, result in swipes:
+        flask_app.record_swipe(profile_id, otherProfileId, result)
+
+
+async def get_metrics(request: Request):
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+class RequestTimer:
+    """ASGI middleware recording per-route latency"""
+
+    def __init__(self, app, paths: dict[Callable, str]) -> None:
+        self.app = app
+        # endpoint -> route path, the label used for the route
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            path = self.paths.get(scope.get("endpoint"), "other")
+            metrics.HTTP_DURATION.observe(time.perf_counter() - started, path, scope["method"], str(status[0]))
+
+
+async def index(request: Request):
+    return HTMLResponse(render("index.html", name="Flinn"))
+
+
+async def tinder(request: Request):
+    return HTMLResponse(render("tinder-test.html", name="Flinn"))
+
+
+async def get_next_match(request: Request):
+    profile_id = flask_app.current_profile_id()
+    try:
+        count = int(request.query_params.get("count", 1))
+    except ValueError:
+        return JSONResponse({"error": "Invalid count"}, status_code=400)
+    if count < 1:
+        return JSONResponse({"error": "Invalid count"}, status_code=400)
+
+    matches = await run_blocking(next_matches, profile_id, min(count, flask_app.MAX_CARDS_PER_REQUEST))
+    if isinstance(matches, JSONResponse):
+        return matches
+    if "count" in request.query_params:
+        return JSONResponse({"matches": matches})
+    if not matches:
+        return JSONResponse({"error": "No more matches"}, status_code=404)
+    return JSONResponse(matches[0])
+
+
+async def read_json(request: Request) -> Any:
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def update_match(request: Request):
+    profile_id = flask_app.current_profile_id()
+    try:
+        otherProfileId, result = flask_app.parse_swipe(await read_json(request), profile_id)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        done = await run_blocking(record_swipes, profile_id, [(otherProfileId, result)])
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if isinstance(done, JSONResponse):
+        return done
+    return JSONResponse({"message": f"Match {profile_id}-{otherProfileId} updated successfully", "result": result})
+
+
+async def update_matches(request: Request):
+    profile_id = flask_app.current_profile_id()
+    data = await read_json(request)
+    if not isinstance(data, list):
+        return JSONResponse({"error": "Expected a list of swipes"}, status_code=400)
+    if len(data) > flask_app.MAX_SWIPES_PER_BATCH:
+        return JSONResponse({"error": f"At most {flask_app.MAX_SWIPES_PER_BATCH} swipes per batch"}, status_code=400)
+    try:
+        swipes = [flask_app.parse_swipe(item, profile_id) for item in data]
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        done = await run_blocking(record_swipes, profile_id, swipes)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if isinstance(done, JSONResponse):
+        return done
+    return JSONResponse({"message": f"{len(swipes)} matches of {profile_id} updated successfully", "count": len(swipes)})
+
+
+app = Starlette(routes=[
+    Route("/metrics", get_metrics),
+    Route("/", index),
+    Route("/tinder", tinder),
+    Route("/match", get_next_match, methods=["GET"]),
+    Route("/match", update_match, methods=["POST"]),
+    Route("/match/batch", update_matches, methods=["POST"]),
+    Mount("/static", StaticFiles(directory=os.path.join(flask_app.app.root_path, "static")), name="static"),
+])
+if metrics.enabled:
+    app.add_middleware(RequestTimer, paths={route.endpoint: route.path for route in app.routes if isinstance(route, Route)})
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,24 @@
+import pytest
+
+import tools.orm as orm
+
+
+@pytest.fixture
+def db(tmp_path):
+    """An empty, migrated database"""
+    database = orm.Database(str(tmp_path / "test.sqlite"))
+    database.migrate()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def profile_db(db):
+    """Database with the profiles 1, 2 and 3"""
+    for number in range(1, 4):
+        user = orm.User.create(db.path, username=f"user{number}", email=f"{number}@x", password="x")
+        orm.Profile.create(
+            db.path, user_id=user.user_id, first_name=f"P{number}", last_name="Test",
+            date_of_birth=0, gender=number % 2, home_address="", hair_colour="Blond",
+        )
+    return db
@@ -1,46 +1,142 @@
 export class MatchClient {
-  constructor(baseUrl = "/match") {
+  // prefetch: cards fetched per GET /match?count=N
+  // lowWater: fetch more cards once fewer than this are buffered
+  // batchSize / flushDelay: swipes are posted together once batchSize are
+  // queued or flushDelay ms after the first one, whichever comes first
+  constructor(baseUrl = "/match", { prefetch = 10, lowWater = 3, batchSize = 10, flushDelay = 2000 } = {}) {
     this.baseUrl = baseUrl;
-  }
+    this.prefetch = prefetch;
+    this.lowWater = lowWater;
+    this.batchSize = batchSize;
+    this.flushDelay = flushDelay;
 
-  // GET /match → get next match
-  async getNextMatch() {
-    const res = await fetch(this.baseUrl, {
-      method: "GET",
-      headers: {
-        "Accept": "application/json"
+    this.cards = [];
+    this.fetching = null;
+    this.exhausted = false;
+
+    this.swipes = [];
+    this.flushTimer = null;
+    this.flushWaiters = [];
+
+    // Swipes still queued when the page goes away are sent with a beacon
+    addEventListener("pagehide", () => this.flushOnUnload());
+    document.addEventListener("visibilitychange", () => {
+      if (document.visibilityState === "hidden") {
+        this.flushOnUnload();
       }
     });
+  }
+
+  // GET /match?count=N → fill the card buffer
+  fetchCards() {
+    if (!this.fetching) {
+      this.fetching = (async () => {
+        try {
+          const res = await fetch(`${this.baseUrl}?count=${this.prefetch}`, {
+            method: "GET",
+            headers: {
+              "Accept": "application/json"
+            }
+          });
+
+          if (!res.ok) {
+            throw new Error(`Failed to get matches (${res.status})`);
+          }
 
-    if (!res.ok) {
-      throw new Error(`Failed to get match (${res.status})`);
+          const { matches } = await res.json();
+          this.exhausted = matches.length < this.prefetch;
+          this.cards.push(...matches);
+        } finally {
+          this.fetching = null;
+        }
+      })();
+    }
+    return this.fetching;
+  }
+
+  // Next card from the buffer, null once there are no more matches
+  async getNextMatch() {
+    if (this.cards.length === 0) {
+      await this.fetchCards();
     }
 
-    return await res.json();
+    const match = this.cards.shift() ?? null;
+    if (this.cards.length < this.lowWater && !this.exhausted) {
+      // Refill in the background before the buffer runs dry
+      this.fetchCards().catch((err) => console.error(err));
+    }
+    return match;
   }
 
-  // POST /match → update match (success / denial)
-  async updateMatch(otherProfileId, result) {
+  // Queue a swipe (success / denial); resolves once its batch was posted
+  updateMatch(otherProfileId, result) {
     if (result !== "success" && result !== "denial") {
       throw new Error("result must be 'success' or 'denial'");
     }
 
-    const res = await fetch(this.baseUrl, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-      },
-      body: JSON.stringify({
-        otherProfileId,
-        result
-      })
-    });
+    this.swipes.push({ otherProfileId, result });
+    const posted = new Promise((resolve, reject) => this.flushWaiters.push({ resolve, reject }));
 
-    if (!res.ok) {
-      throw new Error(`Failed to update match (${res.status})`);
+    // A failed post rejects the waiters' promises; only log it here
+    if (this.swipes.length >= this.batchSize) {
+      this.flush().catch((err) => console.error(err));
+    } else if (!this.flushTimer) {
+      this.flushTimer = setTimeout(() => this.flush().catch((err) => console.error(err)), this.flushDelay);
     }
+    return posted;
+  }
 
-    return await res.json();
+  takeSwipes() {
+    clearTimeout(this.flushTimer);
+    this.flushTimer = null;
+    const swipes = this.swipes;
+    const waiters = this.flushWaiters;
+    this.swipes = [];
+    this.flushWaiters = [];
+    return { swipes, waiters };
+  }
+
+  // POST /match/batch → send all queued swipes at once
+  async flush() {
+    const { swipes, waiters } = this.takeSwipes();
+    if (swipes.length === 0) {
+      return null;
+    }
+
+    try {
+      const res = await fetch(`${this.baseUrl}/batch`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "Accept": "application/json"
+        },
+        body: JSON.stringify(swipes)
+      });
+
+      if (!res.ok) {
+        throw new Error(`Failed to update matches (${res.status})`);
+      }
+
+      const feedback = await res.json();
+      waiters.forEach(({ resolve }) => resolve(feedback));
+      return feedback;
+    } catch (err) {
+      waiters.forEach(({ reject }) => reject(err));
+      throw err;
+    }
+  }
+
+  flushOnUnload() {
+    const { swipes, waiters } = this.takeSwipes();
+    if (swipes.length === 0) {
+      return;
+    }
+
+    const body = new Blob([JSON.stringify(swipes)], { type: "application/json" });
+    if (navigator.sendBeacon(`${this.baseUrl}/batch`, body)) {
+      waiters.forEach(({ resolve }) => resolve(null));
+    } else {
+      waiters.forEach(({ reject }) => reject(new Error("Failed to send swipes")));
+    }
   }
 }
@@ -2,8 +2,12 @@ import tools.algo
 import tools.orm
 
 db = tools.orm.Database("test.sqlite")
+db.migrate()
 
 
 a = tools.algo.Algorithm(db)
 
-a.find_match()
\ No newline at end of file
+profile_id = 1
+print(a.rank(profile_id, limit=5))
+print(a.find_match(profile_id))
+a.close()
@@ -0,0 +1,33 @@
+import importlib
+import sys
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # app.py opens schooltinder.db in the working directory on import
+    workdir = tmp_path_factory.mktemp("app")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(workdir)
+        sys.modules.pop("app", None)
+        app = importlib.import_module("app")
+        yield app.app.test_client()
+        app.app.swipes.close()
+        sys.modules.pop("app", None)
+
+
+@pytest.mark.parametrize("query", ["?count=abc", "?count=", "?count=0", "?count=-2"])
+def test_invalid_count_is_rejected(client, query):
+    response = client.get(f"/match{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid count"}
+
+
+@pytest.mark.parametrize("other_profile_id", [0, -3, 1, 999999, "x"])
+def test_invalid_swipe_target_is_rejected(client, other_profile_id):
+    # The current profile is 1 and the database has no profiles
+    response = client.post("/match", json={"otherProfileId": other_profile_id, "result": "success"})
+    assert response.status_code == 400
+    response = client.post("/match/batch", json=[{"otherProfileId": other_profile_id, "result": "denial"}])
+    assert response.status_code == 400
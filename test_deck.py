@@ -0,0 +1,52 @@
+import threading
+
+from tools.deck import MatchDeck
+
+
+class FakeMatcher:
+    """Ranks every user the same; rank() can be held until released"""
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+        self.seen = None
+        self.on_invalidate = []
+        self.ranking = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def rank(self, profile_id, limit):
+        self.ranking.set()
+        self.release.wait()
+        return [(other, 1.0) for other in self.ranked][:limit]
+
+
+def test_refill_of_a_discarded_deck_does_not_reach_the_next_one():
+    matcher = FakeMatcher([2, 3, 4])
+    deck = MatchDeck(matcher, deck_size=3, low_water=0)
+    try:
+        assert deck.take(1, 1) == [2]
+        # A refill ranks with the old preferences while they change
+        matcher.ranking.clear()
+        matcher.release.clear()
+        refill = threading.Thread(target=deck._refill, args=(1,))
+        refill.start()
+        assert matcher.ranking.wait(1)
+        deck.discard(1)
+        matcher.ranked = [5, 6]
+        matcher.release.set()
+        refill.join()
+        assert deck.take(1, 3) == [5, 6]
+    finally:
+        deck.close()
+
+
+def test_discarded_decks_leave_nothing_behind():
+    matcher = FakeMatcher([2, 3])
+    deck = MatchDeck(matcher, deck_size=2)
+    try:
+        for profile_id in range(1, 101):
+            deck.take(profile_id, 1)
+            deck.discard(profile_id)
+        assert len(deck.decks) == 0
+    finally:
+        deck.close()
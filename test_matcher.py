@@ -0,0 +1,198 @@
+import os
+
+import numpy as np
+import pytest
+
+import tools.orm as orm
+from tools import datagen
+from tools.algo import Algorithm, jaccard
+from tools.shards import ShardedMatcher
+
+
+def hair_of(matcher, profile_id):
+    return matcher.store.vectors[matcher.store.row_of[profile_id]][5]
+
+
+def log_entries(db):
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM ProfileChange").fetchone()[0]
+
+
+def test_sync_prunes_the_applied_log(profile_db):
+    matcher = Algorithm(profile_db, cache_size=0)
+    orm.Profile.update_by_id(profile_db.path, 2, hair_colour="Red")
+    assert log_entries(profile_db) > 0
+    assert matcher.sync() == 1
+    assert hair_of(matcher, 2) == 3
+    assert log_entries(profile_db) == 0
+
+
+def test_snapshot_holds_back_pruning_until_it_is_saved(profile_db, tmp_path):
+    path = str(tmp_path / "matcher.snapshot")
+    matcher = Algorithm(profile_db, cache_size=0, snapshot_path=path)
+    orm.Profile.update_by_id(profile_db.path, 2, hair_colour="Red")
+    matcher.sync()
+    # A restart from the snapshot still needs the entry
+    assert log_entries(profile_db) == 1
+    matcher.save_snapshot(path)
+    assert log_entries(profile_db) == 0
+    assert hair_of(Algorithm(profile_db, cache_size=0, snapshot_path=path), 2) == 3
+
+
+def test_pruned_log_forces_a_rebuild(profile_db, tmp_path):
+    path = str(tmp_path / "matcher.snapshot")
+    matcher = Algorithm(profile_db, cache_size=0, snapshot_path=path)
+    orm.Profile.update_by_id(profile_db.path, 2, hair_colour="Red")
+    profile_db.prune_profile_changes(profile_db.change_log_bounds()[1])
+
+    # The snapshot is older than the log
+    assert not Algorithm(profile_db, cache_size=0).load_snapshot(path)
+    assert hair_of(Algorithm(profile_db, cache_size=0, snapshot_path=path), 2) == 3
+    # So is the running matcher: sync() rebuilds instead of missing the change
+    assert matcher.sync() == 3
+    assert hair_of(matcher, 2) == 3
+
+
+def ranked_ids(matcher, profile_ids):
+    return [[other for other, _ in matcher.rank(profile_id, 20)] for profile_id in profile_ids]
+
+
+def test_sharded_rank_equals_single_process_rank(tmp_path):
+    path = str(tmp_path / "seeded.sqlite")
+    datagen.generate(path, 600, seed=7, shards=1)
+    db = orm.Database(path)
+    single = Algorithm(db, cache_size=0)
+    sharded = ShardedMatcher(db, 3, cache_size=0)
+    try:
+        profile_ids = list(range(1, 601))
+        assert ranked_ids(sharded, profile_ids) == ranked_ids(single, profile_ids)
+
+        # Hobbies nobody had at build time, seen first by different shards
+        for profile_id, hobby in [(5, "Segeln"), (7, "Klettern"), (9, "Schach"), (4, "Schach"), (6, "Segeln"), (8, "Klettern")]:
+            orm.Hobby.create(path, profile_id=profile_id, hobby_name=hobby)
+        assert sharded.sync() == single.sync() == 6
+        assert ranked_ids(sharded, profile_ids) == ranked_ids(single, profile_ids)
+    finally:
+        sharded.close()
+        db.close()
+
+
+def test_sharded_rank_caches_only_indexed_profiles(profile_db, monkeypatch):
+    sharded = ShardedMatcher(profile_db, 2)
+    # The owning shard reports it with the ranking, no extra round trip
+    monkeypatch.setattr(sharded, "_is_indexed", lambda profile_id: pytest.fail("asked separately"))
+    try:
+        sharded.rank(2, 5)
+        assert sharded.match_cache.get((2, 5)) is not None
+        # Created after the build and not synced yet: no shard holds it
+        user = orm.User.create(profile_db.path, username="user4", email="4@x", password="x")
+        profile = orm.Profile.create(
+            profile_db.path, user_id=user.user_id, first_name="P4", last_name="Test",
+            date_of_birth=0, gender=0, home_address="", hair_colour="Blond",
+        )
+        sharded.rank(profile.profile_id, 5)
+        assert sharded.match_cache.get((profile.profile_id, 5)) is None
+    finally:
+        sharded.close()
+
+
+@pytest.mark.parametrize("cache_size", [0, 1])
+def test_evicted_matches_leave_no_dependents(profile_db, cache_size):
+    matcher = Algorithm(profile_db, cache_size=cache_size)
+    for profile_id in (1, 2, 3):
+        matcher.rank(profile_id, 5)
+    cached = [key for key in [(1, 5), (2, 5), (3, 5)] if key in matcher.match_cache]
+    assert len(cached) == cache_size
+    assert {key for keys in matcher._cache_dependents.values() for key in keys} == set(cached)
+
+
+def test_snapshot_of_a_replaced_database_is_rebuilt(tmp_path):
+    path = str(tmp_path / "seeded.sqlite")
+    snapshot_path = str(tmp_path / "matcher.snapshot")
+    datagen.generate(path, 200, seed=1, shards=1)
+    db = orm.Database(path)
+    Algorithm(db, cache_size=0, snapshot_path=snapshot_path)
+    db.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    # Same profile ids and an empty change log, but different profiles
+    datagen.generate(path, 200, seed=2, shards=1)
+    db = orm.Database(path)
+    try:
+        assert not Algorithm(db, cache_size=0).load_snapshot(snapshot_path)
+        loaded = Algorithm(db, cache_size=0, snapshot_path=snapshot_path)
+        assert np.array_equal(loaded.store.vectors, Algorithm(db, cache_size=0).store.vectors)
+    finally:
+        db.close()
+
+
+def test_hobby_similarity_is_exact(profile_db):
+    names = [f"Hobby {number}" for number in range(300)]
+    hobbies = {1: names[:2], 2: names[1:12], 3: names[200:203]}
+    for profile_id, profile_hobbies in hobbies.items():
+        orm.Hobby.create_many(profile_db.path, [
+            {"profile_id": profile_id, "hobby_name": name} for name in profile_hobbies
+        ])
+    matcher = Algorithm(profile_db, cache_size=0)
+    ids = matcher.store.arrays["hobby_ids"]
+    # Widened for the eleven hobbies of profile 2
+    assert ids.shape[1] == 11
+    rows = matcher.store.rows([1, 2, 3])
+    for profile_id, profile_hobbies in hobbies.items():
+        query = ids[matcher.store.row_of[profile_id]]
+        expected = [
+            len(set(profile_hobbies) & set(other)) / len(set(profile_hobbies) | set(other))
+            for other in hobbies.values()
+        ]
+        assert np.allclose(jaccard(ids[rows], query), expected)
+
+
+def test_small_candidate_sets_are_scored_exhaustively(tmp_path):
+    path = str(tmp_path / "seeded.sqlite")
+    datagen.generate(path, 600, seed=7, shards=1)
+    db = orm.Database(path)
+    try:
+        evaluation = Algorithm(db, cache_size=0).evaluate_recall(range(1, 101))
+        assert evaluation["recall"] == 1.0
+        assert evaluation["candidates"] == evaluation["exhaustive_candidates"]
+        # The bucket stage alone leaves compatible profiles out
+        bucketed = Algorithm(db, cache_size=0, exhaustive_below=0).evaluate_recall(range(1, 101))
+        assert bucketed["candidates"] < evaluation["candidates"]
+    finally:
+        db.close()
+
+
+def readers(db):
+    with db.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM ProfileChangeReader")]
+
+
+def test_closed_matcher_no_longer_holds_back_pruning(profile_db):
+    matcher = Algorithm(profile_db, cache_size=0)
+    matcher.start_sync(interval=60)
+    assert readers(profile_db) == [matcher.reader_name]
+    orm.Profile.update_by_id(profile_db.path, 2, hair_colour="Red")
+    matcher.close()
+    assert readers(profile_db) == []
+    # The next matcher prunes the entry the closed one never applied
+    Algorithm(profile_db, cache_size=0).close()
+    assert log_entries(profile_db) == 0
+
+
+def test_parallel_build_equals_serial_build(tmp_path):
+    path = str(tmp_path / "seeded.sqlite")
+    datagen.generate(path, 500, seed=3, shards=1)
+    db = orm.Database(path)
+    try:
+        # Wider hobby rows in one partition only
+        orm.Hobby.create_many(path, [{"profile_id": 7, "hobby_name": f"Hobby {number}"} for number in range(12)])
+        serial = Algorithm(db, cache_size=0).store.used_arrays()
+        parallel = Algorithm(db, cache_size=0, build_workers=2).store.used_arrays()
+        assert serial.keys() == parallel.keys()
+        for name in serial:
+            assert serial[name].dtype == parallel[name].dtype
+            assert np.array_equal(serial[name], parallel[name]), name
+    finally:
+        db.close()
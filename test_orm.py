@@ -0,0 +1,262 @@
+import sqlite3
+
+import pytest
+
+import tools.orm as orm
+from tools import models
+
+
+def usernames(db):
+    with db.connection() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT username FROM User"))
+
+
+def test_nested_orm_calls_roll_back_with_the_outer_block(db):
+    with pytest.raises(RuntimeError):
+        with db.connection() as conn:
+            conn.execute("INSERT INTO User (username, email, password) VALUES ('outer', 'o@x', 'x')")
+            orm.User.create(db.path, username="inner", email="i@x", password="x")
+            orm.User.create_many(db.path, [{"username": "bulk", "email": "b@x", "password": "x"}])
+            raise RuntimeError("abort")
+    assert usernames(db) == []
+
+
+def test_nested_orm_calls_commit_with_the_outer_block(db):
+    with db.connection() as conn:
+        conn.execute("INSERT INTO User (username, email, password) VALUES ('outer', 'o@x', 'x')")
+        user = orm.User.create(db.path, username="inner", email="i@x", password="x")
+        orm.User.update_by_id(db.path, user.user_id, username="renamed")
+        # Uncommitted, but visible on the shared connection
+        assert orm.User.get_by_id(db.path, user.user_id).username == "renamed"
+    assert usernames(db) == ["outer", "renamed"]
+
+
+def test_single_calls_commit(db):
+    user = orm.User.create(db.path, username="alice", email="a@x", password="x")
+    user.update(email="alice@x")
+    orm.User.delete_many(db.path, [orm.User.create(db.path, username="bob", email="b@x", password="x")])
+    assert usernames(db) == ["alice"]
+    assert orm.User.get_by_id(db.path, user.user_id).email == "alice@x"
+
+
+@pytest.mark.parametrize("username, email", [
+    ("alice", "other@x"),
+    ("other", "a@x"),
+    # Would make get_by_login("a@x") match two users
+    ("a@x", "other@x"),
+])
+def test_logins_are_unique(db, username, email):
+    orm.User.create(db.path, username="alice", email="a@x", password="x")
+    with pytest.raises(sqlite3.IntegrityError):
+        orm.User.create(db.path, username=username, email=email, password="x")
+    assert usernames(db) == ["alice"]
+
+
+def test_migration_lists_duplicate_logins_and_changes_nothing(tmp_path):
+    database = orm.Database(str(tmp_path / "old.sqlite"))
+    database.migrate(target=5)
+    users = [("alice", "a@x"), ("alice", "b@x"), ("bob", "a@x"), ("c@x", "c@x"), ("b@x", "d@x")]
+    with database.connection() as conn:
+        conn.executemany("INSERT INTO User (username, email, password) VALUES (?, ?, 'x')", users)
+    with pytest.raises(sqlite3.IntegrityError) as error:
+        database.migrate()
+    assert str(error.value).splitlines()[1:] == [
+        "  username 'alice': users 1, 2",
+        "  email 'a@x': users 1, 3",
+        "  'b@x': username of user 5, email of user 2",
+    ]
+    assert database.schema_version == 5
+    with database.connection() as conn:
+        assert [tuple(row) for row in conn.execute("SELECT username, email FROM User ORDER BY user_id")] == users
+        conn.execute("UPDATE User SET username = 'alice2', email = 'b2@x' WHERE user_id = 2")
+        conn.execute("UPDATE User SET email = 'bob@x' WHERE user_id = 3")
+    assert database.migrate() == len(orm.Database.migrations)
+    database.close()
+
+
+def test_failed_migration_keeps_the_earlier_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(orm.Database, "migrations", [*orm.Database.migrations, ["SELECT * FROM Missing"]])
+    database = orm.Database(str(tmp_path / "new.sqlite"))
+    with pytest.raises(sqlite3.OperationalError):
+        database.migrate()
+    assert database.schema_version == len(orm.Database.migrations) - 1
+    database.close()
+
+
+def test_writes_inside_iter_all_commit(db):
+    orm.User.create_many(db.path, [
+        {"username": f"user{number}", "email": f"{number}@x", "password": "x"} for number in range(5)
+    ])
+    for user in orm.User.iter_all(db.path, chunk_size=2):
+        orm.User.update_by_id(db.path, user.user_id, username="renamed")
+        break
+    # Seen by a connection outside the pool
+    with sqlite3.connect(db.path) as conn:
+        assert conn.execute("SELECT username FROM User WHERE user_id = ?", (user.user_id,)).fetchone() == ("renamed",)
+    assert [user.user_id for user in orm.User.iter_all(db.path, chunk_size=2)] == [1, 2, 3, 4, 5]
+
+
+def test_databases_for_one_path_share_the_pool(db):
+    user = orm.User.create(db.path, username="alice", email="a@x", password="x")
+    other = orm.Database(db.path)
+    assert other.pool is db.pool
+    other.close()
+    # db still uses the pool
+    assert db.migrate() == db.schema_version == len(orm.Database.migrations)
+    assert db.get_profiles([]) == []
+    with db.connection() as conn:
+        assert conn.execute("SELECT username FROM User").fetchone()[0] == "alice"
+    # The last one closes it, and the next ORM call opens a new one
+    pool = db.pool
+    db.close()
+    assert pool.closed
+    assert orm.User.get_by_id(db.path, user.user_id).username == "alice"
+    assert orm.Database.get_pool(db.path) is not pool
+
+
+@pytest.fixture
+def user_cache(db):
+    cache = orm.User.enable_cache(db.path)
+    yield cache
+    orm.User.disable_cache()
+
+
+def test_cached_lookups_hit_after_a_miss(db, user_cache):
+    # fetch=False: nothing read back, nothing cached
+    user, = orm.User.create_many(db.path, [{"username": "alice", "email": "a@x", "password": "x"}], fetch=False)
+    for _ in range(2):
+        assert orm.User.get_by_id(db.path, user.user_id).username == "alice"
+        assert orm.User.get_by_login("a@x").user_id == user.user_id
+        assert orm.User.get_by_username("alice").email == "a@x"
+    # Only the first get_by_id went to SQLite; the logins found the cached row
+    assert user_cache.stats()["misses"] == 1
+    assert user_cache.stats()["hits"] == 5
+    # Fresh instances every time
+    assert orm.User.get_by_id(db.path, user.user_id) is not orm.User.get_by_id(db.path, user.user_id)
+
+
+@pytest.mark.parametrize("write", [
+    lambda db, user: user.update(username="renamed"),
+    lambda db, user: (setattr(user, "username", "renamed"), user.save()),
+    lambda db, user: orm.User.update_many(db.path, [{"user_id": user.user_id, "username": "renamed"}]),
+])
+def test_writes_invalidate_the_cache(db, user_cache, write):
+    user = orm.User.create(db.path, username="alice", email="a@x", password="x")
+    orm.User.get_by_id(db.path, user.user_id)
+    write(db, user)
+    assert orm.User.get_by_id(db.path, user.user_id).username == "renamed"
+    # The old alias no longer answers for the changed row
+    assert orm.User.get_by_username("alice") is None
+    assert orm.User.get_by_login("renamed").user_id == user.user_id
+
+
+@pytest.mark.parametrize("delete", [
+    lambda db, user: user.delete(),
+    lambda db, user: orm.User.delete_many(db.path, [user.user_id]),
+])
+def test_deletes_invalidate_the_cache(db, user_cache, delete):
+    user = orm.User.create(db.path, username="alice", email="a@x", password="x")
+    orm.User.get_by_login("alice")
+    delete(db, user)
+    assert orm.User.get_by_id(db.path, user.user_id) is None
+    assert orm.User.get_by_login("alice") is None
+
+
+def test_stale_alias_is_not_answered(db, user_cache):
+    alice = orm.User.create(db.path, username="alice", email="a@x", password="x")
+    orm.User.get_by_username("alice")
+    alice.update(username="renamed")
+    bob = orm.User.create(db.path, username="bob", email="b@x", password="x")
+    bob.update(username="alice")
+    # The alias "alice" still points at the first user's cached row
+    assert orm.User.get_by_username("alice").user_id == bob.user_id
+
+
+def test_change_file_invalidates_other_processes(db, tmp_path):
+    # An existing file: creating it would make the other cache drop everything
+    notify_file = tmp_path / "users.changes"
+    notify_file.touch()
+    notify_path = str(notify_file)
+    user = orm.User.create(db.path, username="alice", email="a@x", password="x")
+    # Two caches on one change file stand in for two processes
+    other = orm.User.enable_cache(db.path, notify_path=notify_path)
+    try:
+        orm.User.get_by_id(db.path, user.user_id)
+        assert other.get(user.user_id) is not None
+        orm.User.enable_cache(db.path, notify_path=notify_path)
+        orm.User.update_by_id(db.path, user.user_id, username="renamed")
+        assert other.get(user.user_id) is None
+        orm.User._cache = other
+        assert orm.User.get_by_id(db.path, user.user_id).username == "renamed"
+    finally:
+        orm.User.disable_cache()
+
+
+def test_create_many_with_mixed_columns_keeps_input_order(profile_db):
+    records = [
+        {"profile_id": 1, "hobby_name": "Lesen"},
+        {"profile_id": 2},
+        models.Hobby(hobby_id=None, profile_id=3, hobby_name="Kino"),
+        {"profile_id": 1, "hobby_name": "Tanzen"},
+    ]
+    for fetch in (True, False):
+        created = orm.Hobby.create_many(profile_db.path, records, fetch=fetch)
+        assert [(hobby.profile_id, hobby.hobby_name) for hobby in created] == [
+            (1, "Lesen"), (2, None), (3, "Kino"), (1, "Tanzen"),
+        ]
+        ids = [hobby.hobby_id for hobby in created]
+        assert ids == sorted(ids)
+        assert [orm.Hobby.get_by_id(profile_db.path, hobby_id).hobby_name for hobby_id in ids] == [
+            "Lesen", None, "Kino", "Tanzen",
+        ]
+
+
+def test_create_many_splits_at_the_variable_limit(db):
+    records = [{"username": f"user{number}", "email": f"{number}@x", "password": "x"} for number in range(25)]
+    with db.connection() as conn:
+        # 75 variables in one statement would be too many; 3 rows of 3 fit
+        previous = conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 10)
+        created = orm.User.create_many(db.path, records)
+        conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, previous)
+    assert [user.username for user in created] == [record["username"] for record in records]
+    assert usernames(db) == sorted(record["username"] for record in records)
+
+
+def test_update_and_delete_many_accept_dicts_models_and_ids(db):
+    users = orm.User.create_many(db.path, [
+        {"username": f"user{number}", "email": f"{number}@x", "password": "x"} for number in range(5)
+    ])
+    first, second, third, fourth, fifth = users
+    second.username = "renamed"
+    assert orm.User.update_many(db.path, [
+        {"user_id": first.user_id, "email": "first@x"},
+        second,
+        models.User(user_id=third.user_id, username="model", email="model@x", password="y"),
+    ]) == 3
+    assert [(user.username, user.email) for user in orm.User.list_all(db.path)][:3] == [
+        ("user0", "first@x"), ("renamed", "1@x"), ("model", "model@x"),
+    ]
+    with pytest.raises(ValueError):
+        orm.User.update_many(db.path, [{"username": "no id"}])
+
+    assert orm.User.delete_many(db.path, [
+        first.user_id, {"user_id": second.user_id}, third.to_model(), fourth, 999,
+    ]) == 4
+    assert usernames(db) == ["user4"]
+
+
+def test_iter_profiles_runs_four_queries_per_chunk(profile_db):
+    orm.Hobby.create_many(profile_db.path, [
+        {"profile_id": profile_id, "hobby_name": f"Hobby {profile_id}"} for profile_id in (1, 3)
+    ])
+    statements = []
+    with profile_db.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            streamed = list(profile_db.iter_profiles(chunk_size=2))
+        finally:
+            conn.set_trace_callback(None)
+    assert streamed == profile_db.get_profiles([1, 2, 3])
+    assert [len(full.hobbies) for full in streamed] == [1, 0, 1]
+    # Two chunks, then the query finding no more profiles
+    assert len(statements) == 2 * 4 + 1
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+import tools.orm as orm
+from tools.seen import SeenFilter
+
+
+def test_mark_rejects_invalid_ids(profile_db):
+    seen = SeenFilter(profile_db.path)
+    seen.bitmap(1)
+    for invalid in (0, -1, -9):
+        with pytest.raises(ValueError):
+            seen.mark(1, invalid)
+    seen.mark(1, 2)
+    assert seen.seen_mask(1, np.array([2, 3, -1, -16])).tolist() == [True, False, False, False]
+
+
+def test_bitmap_is_loaded_from_the_swipe_table(profile_db):
+    orm.Swipe.record_many(profile_db.path, [(1, 3, "denial", 0), (2, 1, "success", 0)])
+    seen = SeenFilter(profile_db.path)
+    assert seen.seen_mask(1, np.array([1, 2, 3])).tolist() == [False, False, True]
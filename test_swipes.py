@@ -0,0 +1,50 @@
+import time
+
+from tools.swipes import SwipeWriter
+
+
+def stored_swipes(db):
+    with db.connection() as conn:
+        return sorted(tuple(row) for row in conn.execute("SELECT profile_id, other_profile_id, result FROM Swipe"))
+
+
+def wait_until(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+
+def test_lone_swipe_is_written_after_max_delay(profile_db):
+    writer = SwipeWriter(profile_db.path, batch_size=500, max_delay=0.05)
+    try:
+        writer.submit(1, 2, "success")
+        # pending() drops to 0 when the batch is taken, before it is written
+        assert wait_until(lambda: stored_swipes(profile_db) == [(1, 2, "success")], 0.5)
+        assert writer.pending() == 0
+    finally:
+        writer.close()
+
+
+def test_refused_swipe_is_dropped_and_the_rest_written(profile_db):
+    matches = []
+    writer = SwipeWriter(profile_db.path, max_delay=10, on_match=lambda *pair: matches.append(pair))
+    writer.submit(1, 2, "success")
+    writer.submit(1, 999999, "success")
+    writer.submit(2, 1, "success")
+    writer.close()
+    assert writer.pending() == 0
+    assert stored_swipes(profile_db) == [(1, 2, "success"), (2, 1, "success")]
+    assert [swipe[:3] for swipe, _ in writer.rejected] == [(1, 999999, "success")]
+    assert matches == [(1, 2)]
+
+    # Later swipes are not held up by the refused one
+    writer = SwipeWriter(profile_db.path, max_delay=0.05)
+    try:
+        writer.submit(3, 999999, "denial")
+        writer.submit(3, 1, "denial")
+        assert wait_until(lambda: (3, 1, "denial") in stored_swipes(profile_db), 0.5)
+    finally:
+        writer.close()
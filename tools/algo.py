@@ -1,207 +1,1113 @@
+import abc
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
 import typing
+import threading
+import time
+from tools import metrics
 from tools import orm
 from tools import models
+from tools import snapshot
+from tools.cache import LRUCache
+from tools.seen import SeenFilter
 from collections import defaultdict
-import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
 
-class Algorithm:
-    def __init__(self, db: orm.Database) -> None:
+logger = logging.getLogger(__name__)
+
+# Encodings used by the generator (test-creatze.py): gender 0=M, 1=W;
+# sexual_preference 0=M, 1=W, 2=Both
+SEXUAL_PREFERENCE_BOTH = 2
+HAIR_COLOURS = {'blond': 0, 'brunette': 1, 'black': 2, 'red': 3, 'grey': 4, 'white': 5}
+SECONDS_PER_YEAR = 365.2425 * 24 * 60 * 60
+
+# Used when a profile has no Preferences row yet
+DEFAULT_AGE_BOUNDS = (18, 99)
+
+# Weighted distance - some features are more important
+FEATURE_WEIGHTS = np.array([
+    2.0,  # min age
+    2.0,  # max age
+    2.0,  # own age
+    2.0,  # gender
+    2.5,  # sexual preference (important!)
+    1.0,  # hair colour
+    0.3,  # pictures count
+], dtype=np.float32)
+FEATURE_COUNT = len(FEATURE_WEIGHTS)
+
+# Hobbies are hashed to ids (see hobby_id) and stored per profile as sorted
+# ids padded with -1, in a column HOBBY_SLOTS wide that is widened when a
+# profile has more hobbies
+HOBBY_SLOTS = 8
+# Weight of the hobby distance, 1 - Jaccard similarity of both hobby sets
+HOBBY_WEIGHT = 8.0
+# MinHash signature of HOBBY_BANDS * HOBBY_BAND_ROWS values; profiles agreeing
+# on all values of one band share that band's bucket key, which makes them
+# candidates for each other like any other shared bucket key
+HOBBY_BANDS = 4
+HOBBY_BAND_ROWS = 2
+MINHASH_SEED = 20240611
+MINHASH_PRIME = (1 << 31) - 1
+
+# Bucket kinds, packed into the high bits of an integer bucket key
+BUCKET_AGE, BUCKET_OWN_AGE, BUCKET_ORIENTATION, BUCKET_HAIR, BUCKET_HOBBY, BUCKET_PROJECTION = range(6)
+# Four feature buckets, then one hobby bucket per MinHash band
+HOBBY_BUCKET_OFFSET = 4
+BUCKETS_PER_PROFILE = HOBBY_BUCKET_OFFSET + HOBBY_BANDS
+
+# Per-row columns stored next to the feature vectors: name -> (dtype, width)
+STORE_COLUMNS = {
+    "bucket_keys": (np.int64, BUCKETS_PER_PROFILE),
+    "hobby_ids": (np.int64, HOBBY_SLOTS),
+    # Raw values for the hard filters (mutual age bounds and sexual preference)
+    "date_of_birth": (np.int64, None),
+    "gender": (np.int8, None),
+    "lower_age_bound": (np.int16, None),
+    "upper_age_bound": (np.int16, None),
+    "sexual_preference": (np.int8, None),
+}
+
+# A matcher reports its change log seq at least this often (seconds), and
+# readers silent for CHANGE_READER_TTL seconds no longer hold back pruning
+CHANGE_READER_HEARTBEAT = 3600.0
+CHANGE_READER_TTL = 24 * 3600.0
+
+# Below this many hard-filtered rows every one of them is scored: comparing
+# their bucket keys costs more than scoring them (about 2.3 ms against 2.9 ms
+# for 8k-16k rows out of 500k profiles) and drops good matches
+EXHAUSTIVE_BELOW = 16_000
+
+# Bump whenever the vector or bucket layout changes, so old snapshots are rebuilt
+INDEX_VERSION = 6
+
+# (a, b) of the MinHash functions h(x) = (a * x + b) mod MINHASH_PRIME; a and
+# x stay below 2**31, so the products fit into uint64
+_minhash_rng = np.random.default_rng(MINHASH_SEED)
+MINHASH_A = _minhash_rng.integers(1, MINHASH_PRIME, HOBBY_BANDS * HOBBY_BAND_ROWS, dtype=np.uint64)
+MINHASH_B = _minhash_rng.integers(0, MINHASH_PRIME, HOBBY_BANDS * HOBBY_BAND_ROWS, dtype=np.uint64)
+
+
+def bucket_key(kind: int, a: int, b: int = 0) -> int:
+    """Pack a bucket kind and up to two small feature values into one int"""
+    return (kind << 32) | ((a & 0xFFFF) << 16) | (b & 0xFFFF)
+
+
+def age_from_timestamp(date_of_birth: int, now: typing.Optional[float] = None) -> int:
+    """Age in whole years for a unix timestamp date of birth"""
+    now = time.time() if now is None else now
+    return int((now - date_of_birth) // SECONDS_PER_YEAR)
+
+
+def preference_values(profile: models.FullProfile) -> tuple[int, int, int]:
+    """(lower age bound, upper age bound, sexual preference) with defaults filled in"""
+    preferences = profile.preferences
+    if preferences is None:
+        return DEFAULT_AGE_BOUNDS[0], DEFAULT_AGE_BOUNDS[1], SEXUAL_PREFERENCE_BOTH
+    sexual_preference = preferences.sexual_preference
+    if sexual_preference is None:
+        sexual_preference = SEXUAL_PREFERENCE_BOTH
+    return preferences.lower_age_bound, preferences.upper_age_bound, sexual_preference
+
+
+def hobby_id(name: str) -> int:
+    """
+    Stable 31 bit id of a hobby name, compared case-insensitively. Hashed
+    rather than interned, so every process (build worker, shard, query path)
+    derives the same id without sharing a vocabulary.
+    """
+    digest = hashlib.blake2b(name.strip().casefold().encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+def hobby_ids(hobbies: typing.Iterable[models.Hobby]) -> list[int]:
+    """Sorted distinct ids of a profile's hobbies"""
+    return sorted({hobby_id(hobby.hobby_name) for hobby in hobbies if hobby.hobby_name})
+
+
+def hobby_slots(hobby_ids: typing.Sequence[int], width: int = HOBBY_SLOTS) -> np.ndarray:
+    """Hobby ids padded with -1 to at least width values"""
+    slots = np.full(max(width, len(hobby_ids)), -1, dtype=np.int64)
+    slots[:len(hobby_ids)] = hobby_ids
+    return slots
+
+
+def pad_columns(array: np.ndarray, width: int) -> np.ndarray:
+    """A 2-D hobby id array padded with -1 columns to width"""
+    if array.shape[1] >= width:
+        return array
+    padded = np.full((len(array), width), -1, dtype=array.dtype)
+    padded[:, :array.shape[1]] = array
+    return padded
+
+
+def minhash_band_keys(hobby_ids: list[int]) -> list[int]:
+    """One bucket key per MinHash band of the hobby set, -1 for an empty set"""
+    if not hobby_ids:
+        return [-1] * HOBBY_BANDS
+    ids = np.array(hobby_ids, dtype=np.uint64)
+    signature = ((MINHASH_A[:, None] * ids[None, :] + MINHASH_B[:, None]) % MINHASH_PRIME).min(axis=1).tolist()
+    keys = []
+    for band in range(HOBBY_BANDS):
+        value = 0
+        for minimum in signature[band * HOBBY_BAND_ROWS:(band + 1) * HOBBY_BAND_ROWS]:
+            value = (value * 1_000_003 + minimum) % MINHASH_PRIME
+        keys.append(bucket_key(BUCKET_HOBBY, band, value))
+    return keys
+
+
+def jaccard(ids: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Jaccard similarity of the hobby ids of every row to the query's; 0 for
+    two empty sets. Both hold distinct ids padded with -1, the query sorted,
+    so every row id is looked up in it by binary search.
+    """
+    query = query[query >= 0]
+    sizes = np.count_nonzero(ids >= 0, axis=1)
+    if len(query) == 0:
+        shared = np.zeros(len(ids), dtype=np.int64)
+    else:
+        positions = np.minimum(np.searchsorted(query, ids), len(query) - 1)
+        shared = np.count_nonzero(query[positions] == ids, axis=1)
+    either = sizes + len(query) - shared
+    return (shared / np.maximum(either, 1)).astype(np.float32)
+
+
+class ProjectionHash:
+    """
+    p-stable LSH for the weighted Euclidean distance used in scoring. Each of
+    ``tables`` hash tables keys a vector by ``projections`` quantized random
+    projections floor((a . x + b) / width), with a ~ N(0, 1) scaled by the
+    square roots of FEATURE_WEIGHTS. Close vectors share a table's bucket
+    with high probability: more projections make buckets smaller and more
+    precise, more tables bring back the matches a single table misses.
+    """
+
+    def __init__(self, tables: int, projections: int, width: float, seed: int = 0) -> None:
+        self.tables = tables
+        self.projections = projections
+        self.width = width
+        self.seed = seed
+        # Every table draws from its own generator, so the first n tables are
+        # the same for any table count and adding tables only adds candidates
+        matrices, offsets = [], []
+        for table in range(tables):
+            rng = np.random.default_rng([seed, table])
+            matrices.append(rng.standard_normal((FEATURE_COUNT, projections)))
+            offsets.append(rng.uniform(0.0, width, projections))
+        self.matrix = (np.hstack(matrices) * np.sqrt(FEATURE_WEIGHTS)[:, None]).astype(np.float32)
+        self.offsets = np.concatenate(offsets).astype(np.float32)
+        # Combines the projections of one table into its 16 bit bucket hash
+        self.mix = np.random.default_rng(seed).integers(1, 1 << 31, projections, dtype=np.int64)
+
+    @property
+    def config(self) -> list[typing.Any]:
+        return [self.tables, self.projections, self.width, self.seed]
+
+    def keys(self, vectors: np.ndarray) -> np.ndarray:
+        """(rows, tables) bucket keys for a (rows, FEATURE_COUNT) or single vector"""
+        vectors = np.atleast_2d(vectors)
+        slots = np.floor((vectors @ self.matrix + self.offsets) / self.width).astype(np.int64)
+        hashes = (slots.reshape(len(vectors), self.tables, self.projections) * self.mix).sum(axis=2) & 0xFFFF
+        return (BUCKET_PROJECTION << 32) | (np.arange(self.tables, dtype=np.int64) << 16) | hashes
+
+
+class VectorStore:
+    """
+    Contiguous per-profile arrays: a float32 feature matrix plus any extra
+    columns registered with add_array(). Every profile gets a dense row id the
+    first time it is stored; updates overwrite that row in place.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024) -> None:
+        self.dim = dim
+        self.size = 0
+        self.capacity = capacity
+        self.row_of: dict[int, int] = {}
+        self.arrays: dict[str, np.ndarray] = {}
+        self.add_array("profile_ids", np.int64)
+        self.add_array("vectors", np.float32, dim)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.arrays["vectors"]
+
+    @property
+    def profile_ids(self) -> np.ndarray:
+        return self.arrays["profile_ids"]
+
+    def add_array(self, name: str, dtype: typing.Any, width: typing.Optional[int] = None, fill: typing.Any = 0) -> None:
+        """Register another per-row column, optionally `width` values wide"""
+        shape = (self.capacity,) if width is None else (self.capacity, width)
+        self.arrays[name] = np.full(shape, fill, dtype=dtype)
+
+    def _grow(self, capacity: int) -> None:
+        for name, array in self.arrays.items():
+            grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+        self.capacity = capacity
+
+    def upsert(self, profile_id: int, **values: typing.Any) -> int:
+        """Store the given columns for profile_id and return its row id"""
+        row = self.row_of.get(profile_id)
+        if row is None:
+            if self.size == self.capacity:
+                self._grow(max(1024, 2 * self.size))
+            row = self.size
+            self.size += 1
+            self.row_of[profile_id] = row
+            self.arrays["profile_ids"][row] = profile_id
+        for name, value in values.items():
+            self.arrays[name][row] = value
+        return row
+
+    def remove(self, profile_id: int) -> typing.Optional[int]:
+        """Forget profile_id and return its former row; the row itself stays allocated"""
+        row = self.row_of.pop(profile_id, None)
+        if row is not None:
+            self.arrays["profile_ids"][row] = -1
+        return row
+
+    def rows(self, profile_ids: typing.Iterable[int]) -> np.ndarray:
+        """Row ids for the given stored profile ids"""
+        row_of = self.row_of
+        return np.fromiter((row_of[profile_id] for profile_id in profile_ids), dtype=np.int64)
+
+    def used_arrays(self) -> dict[str, np.ndarray]:
+        """All columns trimmed to the stored rows"""
+        return {name: array[:self.size] for name, array in self.arrays.items()}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> "VectorStore":
+        """Adopt existing columns (e.g. memory-mapped ones) without copying them"""
+        store = cls.__new__(cls)
+        store.arrays = dict(arrays)
+        store.dim = store.arrays["vectors"].shape[1]
+        store.size = store.capacity = len(store.arrays["profile_ids"])
+        store.row_of = {
+            profile_id: row for row, profile_id in enumerate(store.arrays["profile_ids"].tolist()) if profile_id >= 0
+        }
+        return store
+
+
+class HardFilter:
+    """
+    Mutual age / sexual preference prefilter over the store rows.
+
+    Rows are kept sorted by date of birth per gender, so the rows inside a
+    profile's age bounds are found with two binary searches per gender. Rows
+    changed since the last sort are checked directly until there are enough
+    of them to make re-sorting worthwhile.
+    """
+
+    def __init__(self, store: VectorStore) -> None:
+        self.store = store
+        # gender -> (sorted dates of birth, rows in the same order)
+        self._sorted: typing.Optional[dict[int, tuple[np.ndarray, np.ndarray]]] = None
+        self._changed: set[int] = set()
+
+    def mark_changed(self, row: int) -> None:
+        if self._sorted is not None:
+            self._changed.add(row)
+
+    def _rebuild(self) -> None:
+        size = self.store.size
+        date_of_birth = self.store.arrays["date_of_birth"][:size]
+        gender = self.store.arrays["gender"][:size]
+        self._sorted = {}
+        for value in np.unique(gender).tolist():
+            rows = np.flatnonzero(gender == value)
+            order = np.argsort(date_of_birth[rows], kind="stable")
+            self._sorted[value] = (date_of_birth[rows][order], rows[order])
+        self._changed.clear()
+
+    def query(self, date_of_birth: int, gender: int, lower_age_bound: int, upper_age_bound: int,
+              sexual_preference: int, now: typing.Optional[float] = None) -> np.ndarray:
+        """Rows that fit this profile's preferences and whose preferences fit this profile"""
+        if self._sorted is None or len(self._changed) > max(1000, self.store.size // 100):
+            self._rebuild()
+        now = time.time() if now is None else now
+        my_age = age_from_timestamp(date_of_birth, now)
+        # age in [lower, upper]  <=>  date of birth in (oldest, youngest]
+        youngest = now - lower_age_bound * SECONDS_PER_YEAR
+        oldest = now - (upper_age_bound + 1) * SECONDS_PER_YEAR
+        if sexual_preference == SEXUAL_PREFERENCE_BOTH:
+            genders = list(self._sorted)
+        else:
+            genders = [sexual_preference]
+
+        parts = []
+        for value in genders:
+            if value not in self._sorted:
+                continue
+            dates, rows = self._sorted[value]
+            start, end = np.searchsorted(dates, [oldest, youngest], side="right")
+            parts.append(rows[start:end])
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+        arrays = self.store.arrays
+        if self._changed:
+            changed = np.fromiter(self._changed, dtype=np.int64, count=len(self._changed))
+            rows = rows[~np.isin(rows, changed)]
+            changed_dates = arrays["date_of_birth"][changed]
+            inside = (changed_dates > oldest) & (changed_dates <= youngest)
+            if sexual_preference != SEXUAL_PREFERENCE_BOTH:
+                inside &= arrays["gender"][changed] == sexual_preference
+            rows = np.concatenate([rows, changed[inside]])
+
+        # The other direction: my age and gender must fit their preferences
+        their_preference = arrays["sexual_preference"][rows]
+        mutual = (
+            (arrays["lower_age_bound"][rows] <= my_age)
+            & (arrays["upper_age_bound"][rows] >= my_age)
+            & ((their_preference == SEXUAL_PREFERENCE_BOTH) | (their_preference == gender))
+        )
+        return rows[mutual]
+
+
+class RankedMatcher(abc.ABC):
+    """
+    What every matcher shares: rank() caches results per (profile_id, limit)
+    until one of the involved profiles is invalidated, and start_sync() keeps
+    the index up to date from the change log. Subclasses provide
+    _rank_uncached(), _is_indexed(), sync() and save_snapshot().
+    """
+
+    def __init__(
+        self,
+        db: orm.Database,
+        cache_size: int = 10_000,
+        cache_ttl: typing.Optional[float] = 300.0,
+        cache_max_bytes: typing.Optional[int] = 64 * 1024 * 1024,
+        snapshot_path: typing.Optional[str] = None,
+        seen: typing.Optional[SeenFilter] = None,
+    ) -> None:
         self.db = db
-        # Buckets: Key = bucket_id, Value = set of profile_ids
-        self.buckets = defaultdict(set)
-        self._build_index()
-    
+        # Profiles a user already swiped are never ranked for them again
+        self.seen = seen
+        # Ranked matches: Key = (profile_id, limit), Value = (profile_ids, scores)
+        self.match_cache = LRUCache(
+            max_entries=cache_size,
+            ttl=cache_ttl,
+            max_bytes=cache_max_bytes,
+            sizeof=lambda value: value[0].nbytes + value[1].nbytes + 200,
+            on_evict=self._forget_cached,
+        )
+        # Reverse index: profile_id -> cache keys whose result depends on it
+        self._cache_dependents: dict[int, set[tuple[int, int]]] = defaultdict(set)
+        # Reentrant: on_evict takes it again while _cache_result() holds it
+        self._cache_lock = threading.RLock()
+        # Bumped on every invalidation so results computed meanwhile are not cached
+        self._cache_generation = 0
+        # Called with the profile_id on every invalidate()
+        self.on_invalidate: list[typing.Callable[[int], None]] = []
+        # Seq of the last ProfileChange entry reflected in the index
+        self.last_seq = 0
+        # Name under which last_seq is recorded in ProfileChangeReader
+        self.reader_name = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._reported: tuple[typing.Optional[int], float] = (None, 0.0)
+        self.snapshot_path = snapshot_path
+        self._sync_lock = threading.Lock()
+        self._sync_stop: typing.Optional[threading.Event] = None
+        self._sync_thread: typing.Optional[threading.Thread] = None
+
+    @abc.abstractmethod
+    def _rank_uncached(
+        self, profile: models.FullProfile | str | int, limit: int, exhaustive: bool = False
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Best matching profile ids and their scores, best first"""
+
+    @abc.abstractmethod
+    def _is_indexed(self, profile_id: int) -> bool:
+        """Whether rank() results for profile_id may be cached"""
+
+    @abc.abstractmethod
+    def sync(self, batch_size: int = 10_000) -> int:
+        """Apply the profiles changed since last_seq to the index; returns how many were applied"""
+
+    @abc.abstractmethod
+    def save_snapshot(self, path: str) -> None:
+        """Write the index to path, to be loaded instead of rebuilt on the next start"""
+
+    def _rank_cacheable(self, profile_id: int, limit: int) -> tuple[np.ndarray, np.ndarray, bool]:
+        """_rank_uncached() plus whether the result may be cached"""
+        profile_ids, scores = self._rank_uncached(profile_id, limit)
+        return profile_ids, scores, self._is_indexed(profile_id)
+
+    def _missed_changes(self, seq: int) -> bool:
+        """Whether the change log was pruned past seq, so changes after it are lost"""
+        oldest_seq, last_seq = self.db.change_log_bounds()
+        return seq < last_seq and (oldest_seq is None or oldest_seq > seq + 1)
+
+    def _report_progress(self) -> None:
+        """
+        Record last_seq as applied by this matcher and prune the change log
+        entries every reader has applied. Writes only when last_seq moved or
+        the last report is CHANGE_READER_HEARTBEAT seconds old.
+        """
+        reported_seq, reported_at = self._reported
+        if self.last_seq == reported_seq and time.monotonic() - reported_at < CHANGE_READER_HEARTBEAT:
+            return
+        self.db.record_profile_changes_read(self.reader_name, self.last_seq)
+        self._reported = (self.last_seq, time.monotonic())
+        self.db.prune_read_profile_changes(CHANGE_READER_TTL)
+
+    def _load_profile(self, profile: models.FullProfile | str | int) -> typing.Optional[models.FullProfile]:
+        """Load profile if an ID is provided"""
+        if isinstance(profile, (str, int)):
+            return self.db.get_profile(int(profile))
+        return profile
+
+    def find_match(self, profile: models.FullProfile | str | int) -> typing.Optional[models.FullProfile]:
+        """Find single best match"""
+        matches = self.find_match_multiple(profile)
+        return matches[0] if matches else None
+
+    def _cache_result(self, key: tuple[int, int], value: tuple[np.ndarray, np.ndarray], generation: int) -> None:
+        """
+        Cache a rank() result unless a profile was invalidated since generation.
+        The check, the dependents and the entry change under one lock: invalidate()
+        either finds the entry through its dependents or makes this skip it.
+        """
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            # The entry this replaces forgets its own dependents first
+            self.match_cache.pop(key)
+            self._cache_dependents[key[0]].add(key)
+            for profile_id in value[0].tolist():
+                self._cache_dependents[profile_id].add(key)
+            # An entry evicted right away is forgotten again through on_evict
+            self.match_cache.set(key, value)
+
+    def _forget_cached(self, key: tuple[int, int], value: tuple[np.ndarray, np.ndarray]) -> None:
+        """Called by the cache for every entry it drops"""
+        with self._cache_lock:
+            for profile_id in [key[0], *value[0].tolist()]:
+                keys = self._cache_dependents.get(profile_id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._cache_dependents[profile_id]
+
+    def invalidate(self, profile_id: int) -> None:
+        """Drop the cached matches of profile_id and every cached list containing it"""
+        with self._cache_lock:
+            self._cache_generation += 1
+            keys = list(self._cache_dependents.get(int(profile_id), ()))
+        for key in keys:
+            self.match_cache.pop(key)
+        for callback in self.on_invalidate:
+            callback(int(profile_id))
+
+    def rank(self, profile: models.FullProfile | str | int, limit: int = 20) -> list[tuple[int, float]]:
+        """
+        Best matching profile ids with their scores, best first.
+        Results for profiles given by id are cached until one of the involved
+        profiles is re-indexed.
+        """
+        if not isinstance(profile, (str, int)):
+            profile_ids, scores = self._rank_uncached(profile, limit)
+            return list(zip(profile_ids.tolist(), scores.tolist()))
+
+        key = (int(profile), limit)
+        cached = self.match_cache.get(key)
+        if cached is not None and self.seen is not None:
+            # Drop what was swiped since; a full list that lost entries is recomputed
+            unseen = ~self.seen.seen_mask(key[0], cached[0])
+            if not unseen.all():
+                if len(cached[0]) == limit:
+                    self.match_cache.pop(key)
+                    cached = None
+                else:
+                    cached = (cached[0][unseen], cached[1][unseen])
+        if cached is None and self.match_cache.max_entries == 0:
+            cached = self._rank_uncached(key[0], limit)
+        elif cached is None:
+            generation = self._cache_generation
+            profile_ids, scores, cacheable = self._rank_cacheable(key[0], limit)
+            cached = (profile_ids, scores)
+            if cacheable:
+                self._cache_result(key, cached, generation)
+        profile_ids, scores = cached
+        return list(zip(profile_ids.tolist(), scores.tolist()))
+
+    def find_match_multiple(self, profile: models.FullProfile | str | int) -> list[models.FullProfile]:
+        """Find multiple matches ranked by score"""
+        ranked = self.rank(profile, limit=20)
+
+        # Only the top 20 matches are loaded from the database
+        with metrics.MATCHER_PHASE.time("loading"):
+            return self.db.get_profiles(profile_id for profile_id, _ in ranked)
+
+    def start_sync(self, interval: float = 1.0, snapshot_interval: float = 300.0) -> None:
+        """
+        Call sync() every ``interval`` seconds from a daemon thread. With a
+        snapshot_path the snapshot is rewritten at most every ``snapshot_interval``
+        seconds after changes were applied, so restarts only replay a short log.
+        """
+        if self._sync_stop is not None:
+            return
+        stop = self._sync_stop = threading.Event()
+
+        def run() -> None:
+            saved_at = time.monotonic()
+            unsaved = False
+            while not stop.wait(interval):
+                try:
+                    unsaved |= self.sync() > 0
+                    if unsaved and self.snapshot_path and time.monotonic() - saved_at >= snapshot_interval:
+                        self.save_snapshot(self.snapshot_path)
+                        saved_at = time.monotonic()
+                        unsaved = False
+                except Exception:
+                    logger.exception("Syncing the matcher index failed")
+
+        self._sync_thread = threading.Thread(target=run, name="matcher-sync", daemon=True)
+        self._sync_thread.start()
+
+    def stop_sync(self) -> None:
+        """
+        Stop the sync thread and remove this matcher's ProfileChangeReader row,
+        so it no longer holds back pruning. A later sync() registers it again.
+        """
+        if self._sync_stop is not None:
+            self._sync_stop.set()
+            self._sync_stop = None
+            if self._sync_thread is not threading.current_thread():
+                self._sync_thread.join()
+            self._sync_thread = None
+        with self._sync_lock:
+            self.db.forget_profile_changes_reader(self.reader_name)
+            self._reported = (None, 0.0)
+
+    def close(self) -> None:
+        self.stop_sync()
+
+
+class Algorithm(RankedMatcher):
+    def __init__(
+        self,
+        db: orm.Database,
+        cache_size: int = 10_000,
+        cache_ttl: typing.Optional[float] = 300.0,
+        cache_max_bytes: typing.Optional[int] = 64 * 1024 * 1024,
+        snapshot_path: typing.Optional[str] = None,
+        build_workers: typing.Optional[int] = 1,
+        seen: typing.Optional[SeenFilter] = None,
+        projection_tables: int = 0,
+        projections_per_table: int = 4,
+        projection_width: float = 4.0,
+        projection_seed: int = 0,
+        shard: typing.Optional[tuple[int, int]] = None,
+        exhaustive_below: int = EXHAUSTIVE_BELOW,
+    ) -> None:
+        """
+        Queries whose hard filter leaves fewer than ``exhaustive_below`` rows
+        score all of them; larger sets are narrowed down to the rows sharing a
+        bucket key with the query first. With ``projection_tables`` > 0 those
+        keys come from a ProjectionHash over the weighted feature vector (plus
+        the hobby MinHash band keys) instead of the feature equality buckets;
+        see evaluate_recall() for picking the table and projection counts.
+        With ``shard`` = (index, count) only profiles with profile_id % count
+        == index are indexed.
+        """
+        super().__init__(db, cache_size, cache_ttl, cache_max_bytes, snapshot_path, seen)
+        self.shard = shard
+        self.exhaustive_below = exhaustive_below
+        # Processes used by _build_index; None = one per CPU core
+        self.build_workers = build_workers or os.cpu_count() or 1
+        self.projection_hash = (
+            ProjectionHash(projection_tables, projections_per_table, projection_width, projection_seed)
+            if projection_tables > 0 else None
+        )
+        self._reset_index()
+        if snapshot_path is None:
+            self._build_index()
+        else:
+            self.load_or_build(snapshot_path)
+        # Keeps other readers from pruning the entries this index still needs
+        self._report_progress()
+
+    def owns(self, profile_id: int) -> bool:
+        """Whether profile_id belongs to this instance's shard"""
+        return self.shard is None or profile_id % self.shard[1] == self.shard[0]
+
+    def _is_indexed(self, profile_id: int) -> bool:
+        return profile_id in self.store.row_of
+
+    def _reset_index(self) -> None:
+        # Feature vectors of all indexed profiles, plus the bucket keys of each
+        # row (matched against the query's keys when collecting candidates)
+        # and the raw values used by the hard filter
+        store = VectorStore(FEATURE_COUNT)
+        for name, (dtype, width) in STORE_COLUMNS.items():
+            store.add_array(name, dtype, width)
+        if self.projection_hash is not None:
+            store.add_array("projection_keys", np.int64, self.projection_hash.tables, fill=-1)
+        self._attach(store)
+
+    def _attach(self, store: VectorStore) -> None:
+        self.store = store
+        self.hard_filter = HardFilter(store)
+
     def _build_index(self) -> None:
         """Build index for all profiles in database"""
-        all_profiles = self.db.get_all_profiles()  # Du musst diese Methode implementieren
+        self._reset_index()
+        self.match_cache.clear()
+        # Changes logged while the build reads the tables are applied again by sync()
+        self.last_seq = self.db.change_log_bounds()[1]
+        if self.build_workers > 1:
+            self._build_index_parallel(self.build_workers)
+            return
+        all_profiles = self.db.get_all_profiles()
         for profile in all_profiles:
-            self._index_profile(profile)
-    
-    def _profile_to_vector(self, profile: models.Profile) -> list[float]:
-        """Convert profile preferences to vector"""
+            if self.owns(profile.profile_id):
+                self._index_profile(profile)
+
+    def _partition_bounds(self, parts: int) -> list[int]:
+        """Profile id bounds splitting the table into `parts` ranges of similar size"""
+        with self.db.connection() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM Profile").fetchone()[0]
+            bounds = [-1]
+            for part in range(1, parts):
+                row = conn.execute(
+                    "SELECT profile_id FROM Profile ORDER BY profile_id LIMIT 1 OFFSET ?",
+                    (total * part // parts - 1,),
+                ).fetchone()
+                if row is not None and row[0] > bounds[-1]:
+                    bounds.append(row[0])
+            bounds.append(conn.execute("SELECT COALESCE(MAX(profile_id), -1) FROM Profile").fetchone()[0])
+        return bounds
+
+    def _build_index_parallel(self, workers: int) -> None:
+        """
+        Vectorize profile id ranges in worker processes and merge them in id
+        order, so rows come out exactly as in the serial build.
+        """
+        bounds = self._partition_bounds(workers)
+        # spawn: workers must not inherit the pooled SQLite connections
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            parts = list(pool.map(
+                _build_partition, repeat(self.db.path), bounds[:-1], bounds[1:], repeat(self.shard),
+            ))
+
+        width = max(part["hobby_ids"].shape[1] for part in parts)
+        for part in parts:
+            part["hobby_ids"] = pad_columns(part["hobby_ids"], width)
+        arrays = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        if self.projection_hash is not None:
+            arrays["projection_keys"] = self.projection_hash.keys(arrays["vectors"])
+        self._attach(VectorStore.from_arrays(arrays))
+
+    @staticmethod
+    def _profile_to_vector(profile: models.FullProfile) -> np.ndarray:
+        """Convert profile and preferences to vector"""
         vector = []
-        
-        # Age bucket (divided by 5)
-        vector.append(float(profile.preferences.age[0] // 5))  # min age
-        vector.append(float(profile.preferences.age[1] // 5))  # max age
-        
-        # Lookalike age bucket (divided by 6)
-        vector.append(float(profile.preferences.lookalike_age[0] // 6))
-        vector.append(float(profile.preferences.lookalike_age[1] // 6))
-        
-        # Smoking (1 or 0)
-        vector.append(1.0 if profile.preferences.smoking else 0.0)
-        
-        # Drinking (1 or 0)
-        vector.append(1.0 if profile.preferences.drinking else 0.0)
-        
-        # Objective attractiveness (0-10 scale, keep as is)
-        vector.append(float(profile.preferences.objective_attractiveness))
-        
-        # Gender (encode as number: male=0, female=1, other=2, etc.)
-        gender_map = {'male': 0, 'female': 1, 'other': 2, 'any': 3}
-        vector.append(float(gender_map.get(profile.preferences.gender.lower(), 3)))
-        
-        # Body type (encode as number)
-        body_map = {'slim': 0, 'athletic': 1, 'average': 2, 'curvy': 3, 'any': 4}
-        vector.append(float(body_map.get(profile.preferences.body_type.lower(), 4)))
-        
-        # Relationship type (encode as number)
-        rel_map = {'casual': 0, 'serious': 1, 'friendship': 2, 'any': 3}
-        vector.append(float(rel_map.get(profile.preferences.relationship_type.lower(), 3)))
-        
-        # Hobbies count (simple metric)
-        vector.append(float(len(profile.preferences.hobbies)))
-        
-        # Music taste count
-        vector.append(float(len(profile.preferences.music_taste)))
-        
-        # Pets count
-        vector.append(float(len(profile.preferences.pets)))
-        
-        return vector
-    
-    def _index_profile(self, profile: models.Profile) -> None:
-        """Add profile to buckets for LSH"""
-        profile_id = str(profile.user_id)
-        vector = self._profile_to_vector(profile)
-        
-        # Create bucket keys based on different feature combinations
-        # Bucket 1: Age range
-        age_bucket = f"age_{int(vector[0])}_{int(vector[1])}"
-        self.buckets[age_bucket].add(profile_id)
-        
-        # Bucket 2: Smoking + Drinking
-        lifestyle_bucket = f"lifestyle_{int(vector[4])}_{int(vector[5])}"
-        self.buckets[lifestyle_bucket].add(profile_id)
-        
-        # Bucket 3: Gender + Body type
-        appearance_bucket = f"appear_{int(vector[7])}_{int(vector[8])}"
-        self.buckets[appearance_bucket].add(profile_id)
-        
-        # Bucket 4: Relationship type
-        rel_bucket = f"rel_{int(vector[9])}"
-        self.buckets[rel_bucket].add(profile_id)
-        
-        # Bucket 5: Attractiveness range (grouped)
-        attract_bucket = f"attract_{int(vector[6] // 2)}"
-        self.buckets[attract_bucket].add(profile_id)
-    
-    def _get_candidates(self, profile: models.Profile) -> set[str]:
-        """Get candidate profile IDs from buckets"""
-        vector = self._profile_to_vector(profile)
-        candidates = set()
-        
-        # Get from age bucket (including neighbors)
-        for age_offset in [-1, 0, 1]:
-            age_bucket = f"age_{int(vector[0]) + age_offset}_{int(vector[1]) + age_offset}"
-            candidates.update(self.buckets.get(age_bucket, set()))
-        
-        # Get from lifestyle bucket
-        lifestyle_bucket = f"lifestyle_{int(vector[4])}_{int(vector[5])}"
-        candidates.update(self.buckets.get(lifestyle_bucket, set()))
-        
-        # Get from appearance bucket
-        appearance_bucket = f"appear_{int(vector[7])}_{int(vector[8])}"
-        candidates.update(self.buckets.get(appearance_bucket, set()))
-        
-        # Get from relationship bucket
-        rel_bucket = f"rel_{int(vector[9])}"
-        candidates.update(self.buckets.get(rel_bucket, set()))
-        
-        # Get from attractiveness bucket (including neighbors)
-        for attract_offset in [-1, 0, 1]:
-            attract_bucket = f"attract_{int(vector[6] // 2) + attract_offset}"
-            candidates.update(self.buckets.get(attract_bucket, set()))
-        
-        # Remove self
-        candidates.discard(str(profile.user_id))
-        
-        return candidates
-    
-    def _calculate_distance(self, vec1: list[float], vec2: list[float]) -> float:
-        """Calculate Euclidean distance between two vectors"""
-        # Weighted distance - some features are more important
-        weights = [
-            2.0,  # min age
-            2.0,  # max age
-            1.5,  # lookalike min age
-            1.5,  # lookalike max age
-            3.0,  # smoking (important!)
-            2.5,  # drinking
-            1.5,  # attractiveness
-            2.0,  # gender
-            1.0,  # body type
-            2.5,  # relationship type
-            0.5,  # hobbies count
-            0.5,  # music count
-            0.3,  # pets count
+        lower_age, upper_age, sexual_preference = preference_values(profile)
+
+        # Preferred age bucket (divided by 5)
+        vector.append(float(lower_age // 5))  # min age
+        vector.append(float(upper_age // 5))  # max age
+
+        # Own age bucket (divided by 5)
+        vector.append(float(age_from_timestamp(profile.profile.date_of_birth) // 5))
+
+        # Gender (0 or 1)
+        vector.append(float(profile.profile.gender))
+
+        # Sexual preference (male=0, female=1, both=2)
+        vector.append(float(sexual_preference))
+
+        # Hair colour (encode as number)
+        vector.append(float(HAIR_COLOURS.get(profile.profile.hair_colour.lower(), len(HAIR_COLOURS))))
+
+        # Hobbies are compared as sets, see hobby_ids
+
+        # Pictures count
+        vector.append(float(len(profile.pictures)))
+
+        return np.array(vector, dtype=np.float32)
+
+    @staticmethod
+    def _bucket_keys(vector: np.ndarray, hobby_keys: list[int]) -> list[int]:
+        """Bucket keys a profile with this vector and these MinHash band keys is stored under"""
+        min_age, max_age, own_age, gender, sexual_preference, hair = vector[:6].astype(np.int64).tolist()
+        return [
+            # Bucket 1: Preferred age range
+            bucket_key(BUCKET_AGE, min_age, max_age),
+            # Bucket 2: Own age
+            bucket_key(BUCKET_OWN_AGE, own_age),
+            # Bucket 3: Gender + Sexual preference
+            bucket_key(BUCKET_ORIENTATION, gender, sexual_preference),
+            # Bucket 4: Hair colour
+            bucket_key(BUCKET_HAIR, hair),
+            # Buckets 5+: MinHash bands of the hobby set
+            *hobby_keys,
         ]
-        
-        distance = 0.0
-        for i, (a, b) in enumerate(zip(vec1, vec2)):
-            weight = weights[i] if i < len(weights) else 1.0
-            distance += weight * (a - b) ** 2
-        
-        return math.sqrt(distance)
-    
-    def find_match(self, profile: models.Profile | str) -> models.Profile:
-        """Find single best match"""
-        matches = self.find_match_multiple(profile)
-        return matches[0] if matches else None
-    
-    def find_match_multiple(self, profile: models.Profile | str) -> list[models.Profile]:
-        """Find multiple matches ranked by score"""
-        # Load profile if string ID provided
-        if isinstance(profile, str):
-            profile = self.db.get_profile(profile)
+
+    @staticmethod
+    def _profile_columns(profile: models.FullProfile) -> dict[str, typing.Any]:
+        """Everything the store keeps for one profile"""
+        vector = Algorithm._profile_to_vector(profile)
+        lower_age, upper_age, sexual_preference = preference_values(profile)
+        profile_hobby_ids = hobby_ids(profile.hobbies)
+        return {
+            "vectors": vector,
+            "bucket_keys": Algorithm._bucket_keys(vector, minhash_band_keys(profile_hobby_ids)),
+            "hobby_ids": hobby_slots(profile_hobby_ids),
+            "date_of_birth": profile.profile.date_of_birth,
+            "gender": profile.profile.gender,
+            "lower_age_bound": lower_age,
+            "upper_age_bound": upper_age,
+            "sexual_preference": sexual_preference,
+        }
+
+    def _columns(self, profile: models.FullProfile) -> dict[str, typing.Any]:
+        """_profile_columns() plus the projection keys of this instance"""
+        columns = self._profile_columns(profile)
+        if self.projection_hash is not None:
+            columns["projection_keys"] = self.projection_hash.keys(columns["vectors"])[0]
+        return columns
+
+    def _index_profile(self, profile: models.FullProfile) -> None:
+        """Store (or overwrite) the vector, bucket keys and filter values of profile"""
+        columns = self._columns(profile)
+        arrays = self.store.arrays
+        width = arrays["hobby_ids"].shape[1]
+        if len(columns["hobby_ids"]) > width:
+            arrays["hobby_ids"] = pad_columns(arrays["hobby_ids"], len(columns["hobby_ids"]))
+        else:
+            columns["hobby_ids"] = hobby_slots(columns["hobby_ids"], width)
+        row = self.store.upsert(profile.profile_id, **columns)
+        self.hard_filter.mark_changed(row)
+
+    def _remove_profile(self, profile_id: int) -> None:
+        """Take a deleted profile out of the index for good"""
+        row = self.store.row_of.get(profile_id)
+        if row is None:
+            return
+        self.store.remove(profile_id)
+        arrays = self.store.arrays
+        # No bucket key is negative and no age lies in [1, 0], so both the
+        # bucket and the hard filter reject the row from now on
+        arrays["bucket_keys"][row] = -1
+        if "projection_keys" in arrays:
+            arrays["projection_keys"][row] = -1
+        arrays["lower_age_bound"][row] = 1
+        arrays["upper_age_bound"][row] = 0
+        self.hard_filter.mark_changed(row)
+
+    @staticmethod
+    def _candidate_keys(vector: np.ndarray, hobby_keys: typing.Iterable[int] = ()) -> list[int]:
+        """Bucket keys a row must share one of to be a candidate for this vector and these MinHash band keys"""
+        min_age, max_age, own_age, gender, sexual_preference, hair = vector[:6].astype(np.int64).tolist()
+        keys = []
+
+        # Age bucket (including neighbors)
+        for age_offset in [-1, 0, 1]:
+            keys.append(bucket_key(BUCKET_AGE, min_age + age_offset, max_age + age_offset))
+
+        # Own age bucket (including neighbors)
+        for age_offset in [-1, 0, 1]:
+            keys.append(bucket_key(BUCKET_OWN_AGE, own_age + age_offset))
+
+        # Orientation and hair colour buckets
+        keys.append(bucket_key(BUCKET_ORIENTATION, gender, sexual_preference))
+        keys.append(bucket_key(BUCKET_HAIR, hair))
+
+        # Hobby band keys: profiles with a similar hobby set share a band with
+        # high probability (1 - (1 - J**rows)**bands for Jaccard similarity J).
+        # They widen the same key match as the feature buckets; there is no
+        # separate per-bucket lookup
+        keys.extend(key for key in hobby_keys if key >= 0)
+        return keys
+
+    def _query_keys(self, vector: np.ndarray, hobby_keys: typing.Iterable[int] = ()) -> list[int]:
+        """Candidate bucket keys: projection buckets if configured, feature buckets otherwise"""
+        if self.projection_hash is None:
+            return self._candidate_keys(vector, hobby_keys)
+        keys = self.projection_hash.keys(vector)[0].tolist()
+        keys.extend(key for key in hobby_keys if key >= 0)
+        return keys
+
+    def _score_rows(
+        self, vector: np.ndarray, hobby_ids: np.ndarray, rows: np.ndarray, limit: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Weighted Euclidean distance from vector to every row in one pass, with
+        the hobby sets compared by Jaccard similarity.
+        Returns the best `limit` rows and their scores, best first; equal
+        scores are ordered by profile id, so the result does not depend on
+        row order (or on how the rows are split across shards, whose top lists
+        are merged the same way).
+        """
+        diff = self.store.vectors[rows] - vector
+        hobby_distance = 1.0 - jaccard(self.store.arrays["hobby_ids"][rows], hobby_ids)
+        distances = np.sqrt((diff * diff) @ FEATURE_WEIGHTS + HOBBY_WEIGHT * hobby_distance * hobby_distance)
+        # Convert distance to score (smaller distance = higher score). Ties are
+        # broken on the score, as close distances can round to the same score
+        scores = 1000.0 / (1.0 + distances)
+
+        # Partial selection: only the rows up to the `limit`-th score
+        # (including all rows tied with it) get sorted
+        if len(rows) > limit:
+            kth = -np.partition(-scores, limit - 1)[limit - 1]
+            top = np.flatnonzero(scores >= kth)
+        else:
+            top = np.arange(len(rows))
+        top = top[np.lexsort((self.store.profile_ids[rows[top]], -scores[top]))[:limit]]
+        return rows[top], scores[top]
+
+    def _query_columns(self, profile: models.FullProfile | str | int) -> tuple[typing.Optional[int], typing.Optional[dict[str, typing.Any]]]:
+        """Profile id and store columns, taken from the store when the profile is indexed"""
+        if isinstance(profile, (str, int)):
+            row = self.store.row_of.get(int(profile))
+            if row is not None:
+                return int(profile), {name: array[row] for name, array in self.store.arrays.items()}
+            profile = self._load_profile(profile)
             if not profile:
-                return []
-        
-        # Convert profile to vector
-        my_vector = self._profile_to_vector(profile)
-        
-        # Phase 1: Get candidates from LSH buckets
-        candidate_ids = self._get_candidates(profile)
-        
-        # Phase 2: Calculate distance for all candidates
-        scored_matches = []
-        for candidate_id in candidate_ids:
-            candidate = self.db.get_profile(candidate_id)
-            if not candidate:
+                return None, None
+        return profile.profile_id, self._columns(profile)
+
+    def _candidate_rows(
+        self, profile_id: typing.Optional[int], me: dict[str, typing.Any], exhaustive: bool = False
+    ) -> np.ndarray:
+        # Phase 1: Hard filters - only people both sides would accept
+        rows = self.hard_filter.query(
+            int(me["date_of_birth"]), int(me["gender"]), int(me["lower_age_bound"]),
+            int(me["upper_age_bound"]), int(me["sexual_preference"]),
+        )
+
+        # Phase 2: Of a large set, keep the rows sharing at least one bucket
+        # key (feature, projection or hobby MinHash band) with me (exhaustive:
+        # keep all, for measuring what the buckets miss). This scans the
+        # stored keys of the hard-filtered rows, so it is linear in those
+        # rows, not a sub-linear bucket lookup: the hard filter already
+        # narrowed the rows down, and comparing their keys is cheaper than
+        # uniting per-bucket row sets, some of which hold a sixth of all
+        # profiles. Below exhaustive_below rows scoring them all is cheaper.
+        if not exhaustive and len(rows) >= self.exhaustive_below:
+            hobby_keys = np.asarray(me["bucket_keys"][HOBBY_BUCKET_OFFSET:]).tolist()
+            query_keys = np.array(self._query_keys(me["vectors"], hobby_keys), dtype=np.int64)
+            rows = rows[np.isin(_row_keys(self.store.arrays, rows), query_keys).any(axis=1)]
+        own_row = self.store.row_of.get(profile_id)
+        if own_row is not None:
+            rows = rows[rows != own_row]
+        if self.seen is not None and profile_id is not None:
+            rows = rows[~self.seen.seen_mask(profile_id, self.store.profile_ids[rows])]
+        return rows
+
+    def _rank_uncached(
+        self, profile: models.FullProfile | str | int, limit: int, exhaustive: bool = False
+    ) -> tuple[np.ndarray, np.ndarray]:
+        profile_id, me = self._query_columns(profile)
+        no_matches = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if me is None:
+            return no_matches
+
+        with metrics.MATCHER_PHASE.time("candidates"):
+            rows = self._candidate_rows(profile_id, me, exhaustive)
+        if len(rows) == 0:
+            return no_matches
+
+        # Phase 3: Score all candidate rows at once
+        with metrics.MATCHER_PHASE.time("scoring"):
+            top_rows, scores = self._score_rows(me["vectors"], me["hobby_ids"], rows, limit)
+        return self.store.profile_ids[top_rows], scores
+
+    def evaluate_recall(self, profile_ids: typing.Iterable[int], limit: int = 20) -> dict[str, float]:
+        """
+        Compare the candidates rank() scores against ranking every row that
+        passes the hard filter; only queries leaving at least
+        ``exhaustive_below`` rows lose matches to the buckets. ``recall`` is the mean share of the exhaustive top
+        ``limit`` found (a returned profile scoring at least as well as the
+        exhaustive last place counts, so ties do not matter), ``candidates``
+        and ``exhaustive_candidates`` the mean rows scored per query.
+        """
+        recalls, candidates, exhaustive_candidates = [], [], []
+        for profile_id in profile_ids:
+            profile_id, me = self._query_columns(int(profile_id))
+            if me is None:
+                continue
+            exact_rows = self._candidate_rows(profile_id, me, exhaustive=True)
+            if len(exact_rows) == 0:
                 continue
-            
-            candidate_vector = self._profile_to_vector(candidate)
-            distance = self._calculate_distance(my_vector, candidate_vector)
-            
-            # Convert distance to score (smaller distance = higher score)
-            score = 1000.0 / (1.0 + distance)
-            scored_matches.append((score, candidate))
-        
-        # Sort by score (highest first)
-        scored_matches.sort(key=lambda x: x[0], reverse=True)
-        
-        # Return top 20 matches
-        return [match[1] for match in scored_matches[:20]]
-    
-    def regenerate_preferences(self, profile: models.Profile | str) -> None:
-        """
-        Remove old profile from buckets and re-index with new preferences
-        
-        :param profile: Profile object or user_id string
+            rows = self._candidate_rows(profile_id, me)
+            _, exact_scores = self._score_rows(me["vectors"], me["hobby_ids"], exact_rows, limit)
+            found = 0
+            if len(rows):
+                _, scores = self._score_rows(me["vectors"], me["hobby_ids"], rows, limit)
+                found = int(np.count_nonzero(scores >= exact_scores[-1]))
+            recalls.append(min(found, len(exact_scores)) / len(exact_scores))
+            candidates.append(len(rows))
+            exhaustive_candidates.append(len(exact_rows))
+        if not recalls:
+            return {"recall": 0.0, "candidates": 0.0, "exhaustive_candidates": 0.0, "queries": 0}
+        return {
+            "recall": float(np.mean(recalls)),
+            "candidates": float(np.mean(candidates)),
+            "exhaustive_candidates": float(np.mean(exhaustive_candidates)),
+            "queries": len(recalls),
+        }
+
+    def regenerate_preferences(self, profile: models.FullProfile | str | int) -> None:
+        """
+        Re-index profile with new preferences; its row is overwritten in place
+
+        :param profile: FullProfile object or profile_id
         :raises ValueError: If profile not found
         """
-        # Load profile if string ID provided
-        if isinstance(profile, str):
-            profile = self.db.get_profile(profile)
-            if not profile:
-                raise ValueError(f"Profile not found: {profile}")
-        
-        profile_id = str(profile.user_id)
-        
-        # Remove from all old buckets
-        for bucket_name, bucket_set in self.buckets.items():
-            bucket_set.discard(profile_id)
-        
-        # Re-index with new preferences
-        self._index_profile(profile)
\ No newline at end of file
+        loaded = self._load_profile(profile)
+        if not loaded:
+            raise ValueError(f"Profile not found: {profile}")
+        profile = loaded
+
+        self._index_profile(profile)
+
+        # Cached rankings involving this profile are outdated now
+        self.invalidate(profile.profile_id)
+
+    def sync(self, batch_size: int = 10_000) -> int:
+        """
+        Apply the profiles changed since last_seq, as logged in ProfileChange,
+        to the index. Returns the number of profiles applied; if the log was
+        pruned past last_seq the index is rebuilt and every profile counts.
+        """
+        applied = 0
+        with self._sync_lock:
+            if self._missed_changes(self.last_seq):
+                logger.warning("Change log pruned past seq %s, rebuilding the matcher index", self.last_seq)
+                self._build_index()
+                applied = len(self.store.row_of)
+            while True:
+                last_seq, profile_ids = self.db.profile_changes(self.last_seq, batch_size)
+                if not profile_ids:
+                    break
+                self.apply_profiles(profile_ids, self.db.get_profiles(profile_ids))
+                self.last_seq = last_seq
+                applied += len(profile_ids)
+            self._report_progress()
+        return applied
+
+    def apply_profiles(self, profile_ids: typing.Iterable[int], profiles: typing.Iterable[models.FullProfile]) -> None:
+        """
+        Re-index the given profile ids from their freshly loaded profiles; ids
+        without a profile were deleted. Ids of other shards are skipped.
+        """
+        loaded = {profile.profile_id: profile for profile in profiles}
+        for profile_id in profile_ids:
+            if not self.owns(profile_id):
+                continue
+            profile = loaded.get(profile_id)
+            if profile is None:
+                self._remove_profile(profile_id)
+            else:
+                self._index_profile(profile)
+            self.invalidate(profile_id)
+
+    def _index_signature(self) -> str:
+        """Changes whenever vectors or buckets would be computed differently"""
+        layout = [
+            INDEX_VERSION, FEATURE_WEIGHTS.tolist(), HAIR_COLOURS, DEFAULT_AGE_BOUNDS,
+            HOBBY_SLOTS, HOBBY_WEIGHT, HOBBY_BANDS, HOBBY_BAND_ROWS, MINHASH_SEED,
+            self.projection_hash.config if self.projection_hash is not None else None,
+        ]
+        return hashlib.sha1(json.dumps(layout).encode()).hexdigest()
+
+    def save_snapshot(self, path: str) -> None:
+        """Write the store columns to a memory-mappable snapshot file"""
+        with self._sync_lock:
+            arrays = self.store.used_arrays()
+            meta = {
+                "index_version": INDEX_VERSION,
+                "signature": self._index_signature(),
+                "database_id": self.db.database_id,
+                "change_seq": self.last_seq,
+                "created_at": time.time(),
+            }
+            snapshot.write_snapshot(path, arrays, meta)
+            # A restart replays the log from here, so the snapshot is a reader too
+            self.db.record_profile_changes_read(f"snapshot:{os.path.abspath(path)}", self.last_seq)
+            self.db.prune_read_profile_changes(CHANGE_READER_TTL)
+
+    def load_snapshot(self, path: str) -> bool:
+        """
+        Open a snapshot instead of building the index and apply the changes
+        logged since it was written. Returns False if the file is missing, was
+        written by a different index layout or for another database (e.g. one
+        generated again at the same path), or the change log no longer reaches
+        back to it.
+        """
+        try:
+            meta = snapshot.read_meta(path)
+        except (OSError, ValueError):
+            return False
+        if meta.get("signature") != self._index_signature() or meta.get("database_id") != self.db.database_id:
+            return False
+        change_seq = meta.get("change_seq")
+        if change_seq is None or change_seq > self.db.change_log_bounds()[1] or self._missed_changes(change_seq):
+            return False
+
+        _, arrays = snapshot.read_snapshot(path)
+        self._attach(VectorStore.from_arrays(arrays))
+        self.match_cache.clear()
+        self.last_seq = change_seq
+        self.sync()
+        return True
+
+    def load_or_build(self, path: str) -> bool:
+        """Load the snapshot at path, or rebuild and save it if it is unusable. True if loaded."""
+        if self.load_snapshot(path):
+            return True
+        self._build_index()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.save_snapshot(path)
+        return False
+
+
+def _row_keys(arrays: dict[str, typing.Any], rows: typing.Any = slice(None)) -> np.ndarray:
+    """Bucket keys of the given rows: feature and hobby buckets, then projection buckets if any"""
+    bucket_keys = np.asarray(arrays["bucket_keys"])[rows]
+    if "projection_keys" not in arrays:
+        return bucket_keys
+    return np.hstack([bucket_keys, np.asarray(arrays["projection_keys"])[rows]])
+
+
+def _build_partition(
+    db_path: str, after_id: int, until_id: int, shard: typing.Optional[tuple[int, int]] = None
+) -> dict[str, np.ndarray]:
+    """
+    Store columns for after_id < profile_id <= until_id (runs in a worker
+    process).
+    """
+    db = orm.Database(db_path, pool_size=1)
+    columns: dict[str, list] = {"profile_ids": [], "vectors": [], **{name: [] for name in STORE_COLUMNS}}
+    for profile in db.iter_profiles(after_id=after_id, until_id=until_id):
+        if shard is not None and profile.profile_id % shard[1] != shard[0]:
+            continue
+        columns["profile_ids"].append(profile.profile_id)
+        for name, value in Algorithm._profile_columns(profile).items():
+            columns[name].append(value)
+    db.close()
+
+    # Every row as wide as the profile with the most hobbies
+    hobby_width = max(map(len, columns["hobby_ids"]), default=HOBBY_SLOTS)
+    columns["hobby_ids"] = [hobby_slots(ids, hobby_width) for ids in columns["hobby_ids"]]
+    specs = {
+        "profile_ids": (np.int64, None), "vectors": (np.float32, FEATURE_COUNT), **STORE_COLUMNS,
+        "hobby_ids": (np.int64, hobby_width),
+    }
+    arrays = {}
+    for name, (dtype, width) in specs.items():
+        array = np.array(columns[name], dtype=dtype)
+        arrays[name] = array.reshape(-1, width) if width is not None else array
+    return arrays
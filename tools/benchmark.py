@@ -0,0 +1,297 @@
+"""
+Reproducible benchmarks for the ORM, the matcher index build and matching.
+
+    python -m tools.benchmark --sizes 10000 100000 --output bench.json
+    python -m tools.benchmark --sizes 10000 --baseline bench.json
+
+With ``--projections 8x2x16 ...`` the recall of the projection LSH index is
+measured for each TABLESxPROJECTIONSxWIDTH configuration next to the default
+buckets, to pick a recall/latency trade-off. The recall matchers narrow down
+every query (``--exhaustive-below 0``, the default), so the numbers compare the
+candidate stages themselves; with ``--exhaustive-below N`` queries whose hard
+filter leaves fewer than N rows score every row instead, as the matcher does in
+production with ``algo.EXHAUSTIVE_BELOW``.
+
+Every size gets its own database, seeded deterministically from ``--seed`` and
+kept in ``--data-dir`` for later runs. Results are written as JSON; with
+``--baseline`` every metric is compared against an earlier result file and the
+exit code is 1 if one got worse by more than ``--tolerance``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+import numpy as np
+
+from tools import algo, datagen, orm
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+# Metrics ending in one of these get better when they grow; all others when they shrink
+HIGHER_IS_BETTER = ("_per_s", "_recall")
+
+
+def open_database(data_dir: str, profiles: int, seed: int) -> orm.Database:
+    """The seeded database for this size and seed, generated on first use"""
+    path = os.path.join(data_dir, f"bench-{profiles}-{seed}.db")
+    if os.path.exists(path):
+        with sqlite3.connect(path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM Profile").fetchone()[0]
+        if count != profiles:
+            os.remove(path)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        started = time.perf_counter()
+        datagen.generate(path, profiles, seed)
+        print(f"Seeded {profiles} profiles in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    db = orm.Database(path)
+    db.migrate()
+    return db
+
+
+def percentiles(samples: list[float], prefix: str) -> dict[str, float]:
+    """p50/p95/p99 of samples in seconds, reported in milliseconds"""
+    values = np.percentile(np.array(samples) * 1000.0, [50, 95, 99])
+    return {f"{prefix}_p50_ms": float(values[0]), f"{prefix}_p95_ms": float(values[1]), f"{prefix}_p99_ms": float(values[2])}
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def bench_crud(db: orm.Database, operations: int) -> dict[str, float]:
+    """
+    Throughput of single-row and bulk ORM writes. They run on a copy of the
+    database, so every run (and every later benchmark) sees the seeded data.
+    """
+    path = f"{db.path}.crud"
+    source, target = sqlite3.connect(db.path), sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    copy = orm.Database(path)
+    try:
+        return _bench_crud(copy, operations)
+    finally:
+        copy.close()
+        # Opening the copy made it the default database of the ORM
+        orm.Database.set_default_path(db.path)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def _bench_crud(db: orm.Database, operations: int) -> dict[str, float]:
+    results = {}
+    records = [
+        {"username": f"bench{i}", "email": f"bench{i}@example.com", "password": "x"} for i in range(operations)
+    ]
+
+    created = []
+    elapsed = timed(lambda: created.extend(orm.User.create(db.path, **record) for record in records[:1000]))
+    results["create_per_s"] = len(created) / elapsed
+    elapsed = timed(lambda: [orm.User.get_by_id(db.path, user.user_id) for user in created])
+    results["get_by_id_per_s"] = len(created) / elapsed
+    elapsed = timed(lambda: [user.update(password="y") for user in created])
+    results["update_per_s"] = len(created) / elapsed
+    elapsed = timed(lambda: [user.delete() for user in created])
+    results["delete_per_s"] = len(created) / elapsed
+
+    bulk = []
+    elapsed = timed(lambda: bulk.extend(orm.User.create_many(db.path, records)))
+    results["create_many_per_s"] = len(bulk) / elapsed
+    changes = [{"user_id": user.user_id, "password": "y"} for user in bulk]
+    elapsed = timed(lambda: orm.User.update_many(db.path, changes))
+    results["update_many_per_s"] = len(changes) / elapsed
+    elapsed = timed(lambda: orm.User.delete_many(db.path, [user.user_id for user in bulk]))
+    results["delete_many_per_s"] = len(bulk) / elapsed
+    return results
+
+
+def bench_login(db: orm.Database, profiles: int, lookups: int, rng: random.Random) -> dict[str, float]:
+    with db.connection() as conn:
+        logins = [
+            tuple(row) for row in conn.execute(
+                "SELECT username, email FROM User WHERE user_id IN (SELECT value FROM json_each(?))",
+                (json.dumps([rng.randint(1, profiles) for _ in range(lookups)]),),
+            )
+        ]
+    chosen = [username if rng.random() < 0.5 else email for username, email in logins]
+    # The first tenth only warms the page and statement caches
+    for username, _ in logins[:lookups // 10]:
+        orm.User.get_by_login(username)
+    samples = [timed(lambda: orm.User.get_by_login(login)) for login in chosen]
+    results = percentiles(samples, "get_by_login")
+
+    # Same lookups through the read-through cache, filled by a first pass
+    orm.User.enable_cache(db.path, max_entries=lookups)
+    try:
+        for login in chosen:
+            orm.User.get_by_login(login)
+        samples = [timed(lambda: orm.User.get_by_login(login)) for login in chosen]
+    finally:
+        orm.User.disable_cache()
+    results.update(percentiles(samples, "get_by_login_cached"))
+    return results
+
+
+def bench_build(db: orm.Database) -> tuple[algo.Algorithm, dict[str, float]]:
+    # No snapshot: always the full build. Timed and traced separately, as
+    # tracemalloc slows the build down considerably.
+    started = time.perf_counter()
+    matcher = algo.Algorithm(db, cache_size=0)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    algo.Algorithm(db, cache_size=0).close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    index_bytes = sum(array.nbytes for array in matcher.store.used_arrays().values())
+    return matcher, {
+        "build_index_s": elapsed,
+        "build_index_peak_mb": peak / 2**20,
+        "index_mb": index_bytes / 2**20,
+    }
+
+
+def bench_matching(matcher: algo.Algorithm, profiles: int, queries: int, rng: random.Random) -> dict[str, float]:
+    samples = []
+    for _ in range(queries // 10):
+        matcher.find_match_multiple(rng.randint(1, profiles))
+    for _ in range(queries):
+        profile_id = rng.randint(1, profiles)
+        samples.append(timed(lambda: matcher.find_match_multiple(profile_id)))
+    return percentiles(samples, "find_match_multiple")
+
+
+def parse_projections(value: str) -> tuple[int, int, float]:
+    """TABLESxPROJECTIONS[xWIDTH], e.g. 8x2 or 8x2x16"""
+    parts = value.lower().split("x")
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"expected TABLESxPROJECTIONS[xWIDTH], got {value!r}")
+    try:
+        return int(parts[0]), int(parts[1]), float(parts[2]) if len(parts) == 3 else 4.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TABLESxPROJECTIONS[xWIDTH], got {value!r}") from None
+
+
+def bench_recall(
+    db: orm.Database, profiles: int, queries: int, rng: random.Random,
+    projections: list[tuple[int, int, float]], exhaustive_below: int = 0,
+) -> dict[str, float]:
+    """Recall against exhaustive ranking and latency, for the default buckets and each projection setup"""
+    sample = [rng.randint(1, profiles) for _ in range(queries)]
+    results = {}
+    setups = [("buckets", algo.Algorithm(db, cache_size=0, exhaustive_below=exhaustive_below))]
+    for tables, per_table, width in projections:
+        setups.append((
+            f"projection_{tables}x{per_table}x{width:g}",
+            algo.Algorithm(
+                db, cache_size=0, exhaustive_below=exhaustive_below,
+                projection_tables=tables, projections_per_table=per_table, projection_width=width,
+            ),
+        ))
+    for name, candidate_matcher in setups:
+        evaluation = candidate_matcher.evaluate_recall(sample)
+        results[f"{name}_recall"] = evaluation["recall"]
+        results[f"{name}_candidates"] = evaluation["candidates"]
+        samples = [timed(lambda: candidate_matcher.rank(profile_id)) for profile_id in sample]
+        results[f"{name}_rank_p50_ms"] = percentiles(samples, f"{name}_rank")[f"{name}_rank_p50_ms"]
+        candidate_matcher.close()
+    return results
+
+
+def run(
+    sizes: list[int], seed: int, data_dir: str, crud_operations: int, queries: int,
+    projections: list[tuple[int, int, float]] = (), exhaustive_below: int = 0,
+) -> dict[str, Any]:
+    results: dict[str, Any] = {
+        "meta": {
+            "seed": seed,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": {},
+    }
+    for profiles in sizes:
+        print(f"Benchmarking {profiles} profiles...", file=sys.stderr)
+        db = open_database(data_dir, profiles, seed)
+        rng = random.Random(seed)
+        metrics: dict[str, float] = {}
+        metrics.update(bench_crud(db, crud_operations))
+        metrics.update(bench_login(db, profiles, queries, rng))
+        matcher, build_metrics = bench_build(db)
+        metrics.update(build_metrics)
+        metrics.update(bench_matching(matcher, profiles, queries, rng))
+        matcher.close()
+        metrics.update(bench_recall(db, profiles, queries, rng, list(projections), exhaustive_below))
+        results["results"][str(profiles)] = metrics
+        db.close()
+    return results
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """One line per metric present in both files; regressions are marked"""
+    lines = []
+    for size, metrics in results["results"].items():
+        for name, value in metrics.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before:
+                continue
+            change = value / before - 1.0
+            worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+            marker = "REGRESSION" if worse > tolerance else ""
+            lines.append(f"{size:>8} {name:<28} {before:>12.3f} -> {value:>12.3f} {change:+8.1%} {marker}".rstrip())
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=".bench")
+    parser.add_argument("--crud-operations", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--projections", type=parse_projections, nargs="*", default=[], metavar="TxPxW",
+                        help="projection LSH setups to evaluate, e.g. 8x2x16 (tables x projections x width)")
+    parser.add_argument("--exhaustive-below", type=int, default=0, metavar="N",
+                        help="recall matchers score every row of filters smaller than N (default 0: never)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this earlier results file")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed relative slowdown (default 0.20)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.seed, args.data_dir, args.crud_operations, args.queries, args.projections,
+                  args.exhaustive_below)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines = compare(results, json.load(f), args.tolerance)
+        print("\n".join(lines), file=sys.stderr)
+        if any(line.endswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an entry limit, an optional TTL and an optional
+    memory budget. ``sizeof`` estimates the bytes of a value; ``on_evict`` is
+    called with (key, value) for every entry that leaves the cache, outside the
+    cache lock.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        # Value: (value, expires_at, size)
+        self._data: OrderedDict[Hashable, tuple[Any, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key: Hashable) -> Any:
+        value, _, size = self._data.pop(key)
+        self._bytes -= size
+        return value
+
+    def _notify(self, removed: list[tuple[Hashable, Any]]) -> None:
+        if self.on_evict is not None:
+            for key, value in removed:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        removed = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[1] <= time.monotonic():
+                removed.append((key, self._remove(key)))
+                self.expirations += 1
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        self._notify(removed)
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        removed = []
+        with self._lock:
+            if key in self._data:
+                removed.append((key, self._remove(key)))
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                oldest = next(iter(self._data))
+                removed.append((oldest, self._remove(oldest)))
+                self.evictions += 1
+        self._notify(removed)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._remove(key)
+        self._notify([(key, value)])
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            removed = [(key, entry[0]) for key, entry in self._data.items()]
+            self._data.clear()
+            self._bytes = 0
+        self._notify(removed)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class ChangeFile:
+    """
+    Change notifications between processes through an append-only local file.
+    publish() appends one line per key ("*" stands for everything); poll()
+    returns the keys other writers appended since the last poll. Every process
+    starts reading at the end of the file. Once the file grows past
+    ``max_bytes`` a writer replaces it with an empty one; readers notice the
+    new inode (or a file that shrank) and poll() returns None: they may have
+    missed keys and have to drop everything.
+    """
+
+    ALL = "*"
+
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inode, self._offset = self._position()
+
+    def _position(self) -> tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_ino, stat.st_size
+
+    def publish(self, keys: Iterable[Any]) -> None:
+        data = "".join(f"{key}\n" for key in keys).encode()
+        if not data:
+            return
+        # One O_APPEND write per call, so lines of concurrent writers never interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            empty = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            open(empty, "wb").close()
+            os.replace(empty, self.path)
+
+    def poll(self) -> Optional[list[str]]:
+        """Keys published since the last poll, or None if the file was replaced"""
+        with self._lock:
+            inode, size = self._position()
+            if inode != self._inode or size < self._offset:
+                # Everything up to now is covered by dropping all entries
+                self._inode, self._offset = inode, size
+                return None
+            if size == self._offset:
+                return []
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            # A line still being written is read on the next poll
+            complete = data.rfind(b"\n") + 1
+            self._offset += complete
+            return data[:complete].decode().split()
+
+
+class RecordCache:
+    """
+    Read-through cache of database rows, (pk, *columns) tuples keyed by their
+    primary key. ``aliases`` maps the names of further lookups to the
+    position of their column in the row. Only columns the schema keeps
+    unique may be aliases; otherwise a hit returns whichever row was cached
+    last. An alias entry only points at the primary key and is checked
+    against the cached row on every hit, so a changed row never answers for
+    its old alias.
+
+    Readers take a token() before querying a missed row and hand it to put();
+    an invalidate() in between makes put() drop the row, which may have been
+    read before the write. With ``changes`` every invalidation is published
+    to the other processes and their invalidations are applied before each
+    lookup.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl: Optional[float] = None,
+        aliases: Optional[dict[str, int]] = None,
+        changes: Optional[ChangeFile] = None,
+    ) -> None:
+        self.rows = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.aliases = aliases or {}
+        self.alias_keys = LRUCache(max_entries=max_entries * max(1, len(self.aliases)), ttl=ttl)
+        self.changes = changes
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _apply_changes(self) -> None:
+        keys = self.changes.poll()
+        if keys is None or ChangeFile.ALL in keys:
+            self._drop_all()
+        elif keys:
+            self._drop(int(key) for key in keys)
+
+    def get(self, record_id: Any) -> Optional[tuple]:
+        if self.changes is not None:
+            self._apply_changes()
+        return self.rows.get(record_id)
+
+    def get_alias(self, name: str, value: Any) -> Optional[tuple]:
+        if self.changes is not None:
+            self._apply_changes()
+        record_id = self.alias_keys.get((name, value))
+        if record_id is None:
+            return None
+        row = self.rows.get(record_id)
+        if row is None or row[self.aliases[name]] != value:
+            return None
+        return row
+
+    def token(self) -> int:
+        return self._generation
+
+    def put(self, row: tuple, token: int) -> None:
+        with self._lock:
+            if token != self._generation:
+                return
+            self.rows.set(row[0], row)
+            for name, position in self.aliases.items():
+                self.alias_keys.set((name, row[position]), row[0])
+
+    def _drop(self, record_ids: Iterable[Any]) -> None:
+        with self._lock:
+            self._generation += 1
+            for record_id in record_ids:
+                self.rows.pop(record_id)
+
+    def _drop_all(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.rows.clear()
+            self.alias_keys.clear()
+
+    def invalidate(self, record_ids: Iterable[Any]) -> None:
+        """Forget rows after they were written, here and in the other processes"""
+        record_ids = list(record_ids)
+        self._drop(record_ids)
+        if self.changes is not None:
+            self.changes.publish(record_ids)
+
+    def clear(self) -> None:
+        self._drop_all()
+        if self.changes is not None:
+            self.changes.publish([ChangeFile.ALL])
+
+    def stats(self) -> dict[str, Any]:
+        return self.rows.stats()
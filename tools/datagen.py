@@ -0,0 +1,218 @@
+"""
+Fast, deterministic fake data for load tests.
+
+    python -m tools.datagen --profiles 1000000 --seed 42 --shards 8 --output load.db
+
+Faker is only used once to fill small value pools; worker processes then build
+rows from those pools in blocks of BLOCK_SIZE profiles, each block with its own
+random generator derived from the seed, so the output does not depend on the
+shard count. The parent inserts the blocks in order with executemany under
+bulk-load PRAGMAs and creates indexes and triggers after the load.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+from tools import orm
+
+BLOCK_SIZE = 10_000
+POOL_SIZE = 2_000
+HAIR_COLOURS = ["Blond", "Brunette", "Black", "Red", "Grey", "White"]
+HOBBIES = ["Fußball", "Lesen", "Reisen", "Kochen", "Gaming", "Musik", "Wandern", "Kino", "Tanzen"]
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+# Birthdays are generated relative to this time, so a seed gives the same rows on every day
+REFERENCE_TIME = 1_700_000_000
+
+# Statements run only after the data is loaded, in migration order (so a
+# later migration's DROP INDEX still follows the CREATE INDEX it undoes)
+DEFERRED_PREFIXES = ("CREATE INDEX", "CREATE UNIQUE INDEX", "DROP INDEX", "CREATE TRIGGER", "ANALYZE")
+
+_pools: dict[str, list[str]] = {}
+
+
+def build_pools(seed: int, locale: str = "de_DE", size: int = POOL_SIZE) -> dict[str, list[str]]:
+    """Value pools the rows are drawn from"""
+    from faker import Faker
+
+    fake = Faker(locale)
+    fake.seed_instance(seed)
+    return {
+        "first_names": [fake.first_name() for _ in range(size)],
+        "last_names": [fake.last_name() for _ in range(size)],
+        "user_names": [fake.user_name() for _ in range(size)],
+        "domains": [fake.free_email_domain() for _ in range(50)],
+        "addresses": [fake.address().replace("\n", ", ") for _ in range(size)],
+        "file_names": [fake.file_name(extension="jpg") for _ in range(size)],
+    }
+
+
+def _init_worker(pools: dict[str, list[str]]) -> None:
+    _pools.update(pools)
+
+
+def generate_block(
+    seed: int, block: int, first_profile_id: int, first_user_id: int, count: int, reference_time: int
+) -> tuple[list, list, list, list, list]:
+    """(users, profiles, preferences, pictures, hobbies) rows of one block"""
+    rng = random.Random(f"{seed}-{block}")
+    pools = _pools
+    users, profiles, preferences, pictures, hobbies = [], [], [], [], []
+    for offset in range(count):
+        profile_id = first_profile_id + offset
+        user_id = first_user_id + offset
+        # The id suffix keeps usernames and emails unique
+        username = f"{rng.choice(pools['user_names'])}{user_id}"
+        users.append((user_id, username, f"{username}@{rng.choice(pools['domains'])}", f"{rng.getrandbits(256):064x}"))
+
+        age = rng.uniform(18, 90)
+        profiles.append((
+            profile_id, user_id, rng.choice(pools["first_names"]), rng.choice(pools["last_names"]),
+            int(reference_time - age * SECONDS_PER_YEAR), rng.randint(0, 1),  # 0=M, 1=W
+            rng.choice(pools["addresses"]), rng.choice(HAIR_COLOURS),
+        ))
+
+        age_base = rng.randint(18, 80)
+        # 0=M, 1=W, 2=Both
+        preferences.append((profile_id, max(18, age_base - 5), age_base + 5, rng.randint(0, 2)))
+        for _ in range(rng.randint(0, 3)):
+            pictures.append((profile_id, f"/images/{profile_id}/{rng.choice(pools['file_names'])}"))
+        for hobby in rng.sample(HOBBIES, k=rng.randint(1, 3)):
+            hobbies.append((profile_id, hobby))
+    return users, profiles, preferences, pictures, hobbies
+
+
+def _insert_block(conn: sqlite3.Connection, rows: tuple[list, list, list, list, list]) -> None:
+    users, profiles, preferences, pictures, hobbies = rows
+    conn.executemany("INSERT INTO User (user_id, username, email, password) VALUES (?, ?, ?, ?)", users)
+    conn.executemany(
+        "INSERT INTO Profile (profile_id, user_id, first_name, last_name, date_of_birth, gender, "
+        "home_address, hair_colour) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        profiles,
+    )
+    conn.executemany(
+        "INSERT INTO Preferences (profile_id, lower_age_bound, upper_age_bound, sexual_preference) "
+        "VALUES (?, ?, ?, ?)",
+        preferences,
+    )
+    conn.executemany("INSERT INTO Pictures (profile_id, path) VALUES (?, ?)", pictures)
+    conn.executemany("INSERT INTO Hobby (profile_id, hobby_name) VALUES (?, ?)", hobbies)
+
+
+def generate(
+    path: str,
+    profiles: int,
+    seed: int = 42,
+    shards: Optional[int] = None,
+    append: bool = False,
+    locale: str = "de_DE",
+    reference_time: int = REFERENCE_TIME,
+    progress: bool = False,
+) -> None:
+    """
+    Write ``profiles`` generated profiles to the database at path. A new
+    database gets the full schema with indexes and triggers created after the
+    load; with ``append`` the profiles are added after the existing ones.
+    """
+    shards = shards or os.cpu_count() or 1
+    exists = os.path.exists(path)
+    if exists and not append:
+        raise FileExistsError(f"{path} exists; remove it or append to it.")
+
+    deferred: list[str | Callable[[sqlite3.Connection], None]] = []
+    if exists:
+        # Existing database: regular schema upgrade, triggers log the new rows
+        db = orm.Database(path)
+        db.migrate()
+        db.close()
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -262144")
+        if not exists:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+            conn.execute("BEGIN")
+            for statements in orm.Database.migrations:
+                for statement in statements:
+                    # Checks (callables) look at the loaded rows, before the indexes exist
+                    if callable(statement) or statement.lstrip().upper().startswith(DEFERRED_PREFIXES):
+                        deferred.append(statement)
+                    else:
+                        conn.execute(statement)
+            conn.execute("COMMIT")
+
+        first_profile_id = conn.execute("SELECT COALESCE(MAX(profile_id), 0) + 1 FROM Profile").fetchone()[0]
+        first_user_id = conn.execute("SELECT COALESCE(MAX(user_id), 0) + 1 FROM User").fetchone()[0]
+        blocks = [
+            (seed, block, first_profile_id + start, first_user_id + start, min(BLOCK_SIZE, profiles - start), reference_time)
+            for block, start in enumerate(range(0, profiles, BLOCK_SIZE))
+        ]
+
+        started = time.perf_counter()
+        pools = build_pools(seed, locale)
+        with ProcessPoolExecutor(max_workers=shards, initializer=_init_worker, initargs=(pools,)) as pool:
+            conn.execute("BEGIN")
+            # Insert in block order while later blocks are generated; at most
+            # two blocks per worker are in flight, which bounds the memory used
+            pending: deque[Future] = deque()
+            remaining = iter(blocks)
+            done = 0
+            while True:
+                while len(pending) < 2 * shards:
+                    block = next(remaining, None)
+                    if block is None:
+                        break
+                    pending.append(pool.submit(generate_block, *block))
+                if not pending:
+                    break
+                _insert_block(conn, pending.popleft().result())
+                done += 1
+                if progress:
+                    print(f"{min(done * BLOCK_SIZE, profiles)} Profile erstellt...", file=sys.stderr)
+            conn.execute("COMMIT")
+
+        conn.execute("BEGIN")
+        for statement in deferred:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(statement)
+        if not exists:
+            conn.execute(f"PRAGMA user_version = {len(orm.Database.migrations)}")
+        conn.execute("COMMIT")
+        if progress:
+            print(f"Fertig! {profiles} Profile in {time.perf_counter() - started:.2f} Sekunden erstellt.", file=sys.stderr)
+    finally:
+        conn.close()
+    if not exists:
+        # The app expects WAL; switching needs a connection without the exclusive lock
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--shards", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", default="schooltinder.db")
+    parser.add_argument("--append", action="store_true", help="add to an existing database")
+    parser.add_argument("--locale", default="de_DE")
+    parser.add_argument("--reference-time", type=int, default=REFERENCE_TIME,
+                        help="unix time birthdays are generated relative to")
+    args = parser.parse_args(argv)
+
+    generate(args.output, args.profiles, args.seed, args.shards, args.append, args.locale,
+             args.reference_time, progress=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+from tools.algo import RankedMatcher
+from tools.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+# How many handed out ids a deck remembers to keep them out of the next refill
+SERVED_MEMORY = 64
+
+
+class _Deck:
+    def __init__(self) -> None:
+        self.profile_ids: deque[int] = deque()
+        # Handed out but maybe not swiped yet
+        self.served: deque[int] = deque(maxlen=SERVED_MEMORY)
+
+
+class MatchDeck:
+    """
+    Per-user deck of ranked profile ids. next() and take() pop from the deck; once a deck
+    has fewer than ``low_water`` ids left a background thread re-ranks the
+    user and replaces it, so ranking only happens on the request path for the
+    first request of a user or a deck that ran dry. discard() drops a deck, e.g. after the
+    user's preferences changed.
+    """
+
+    def __init__(
+        self,
+        matcher: RankedMatcher,
+        deck_size: int = 50,
+        low_water: int = 10,
+        max_decks: int = 10_000,
+    ) -> None:
+        self.matcher = matcher
+        self.deck_size = deck_size
+        self.low_water = low_water
+        # A refill fills the deck object it started with, so one computed
+        # while discard() dropped that deck never reaches the user's next deck
+        self.decks = LRUCache(max_entries=max_decks)
+        self._lock = threading.Lock()
+        self._refill_requested: set[int] = set()
+        self._refill_queue: deque[int] = deque()
+        self._cond = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="match-deck-refill", daemon=True)
+        self._thread.start()
+        # Re-indexed profiles (changed preferences) lose their deck
+        matcher.on_invalidate.append(self.discard)
+
+    def _rank(self, profile_id: int, served: tuple[int, ...] = ()) -> list[int]:
+        # One fixed limit, so all refills of a user share a match cache entry
+        ranked = self.matcher.rank(profile_id, limit=self.deck_size + SERVED_MEMORY)
+        return [other for other, _ in ranked if other not in served][:self.deck_size]
+
+    def _refill(self, profile_id: int, deck: Optional[_Deck] = None) -> None:
+        """Re-rank the user into deck (default: their current deck, if any)"""
+        with self._lock:
+            if deck is None:
+                deck = self.decks.get(profile_id)
+                if deck is None:
+                    return
+            served = tuple(deck.served)
+        profile_ids = self._rank(profile_id, served)
+        with self._lock:
+            deck.profile_ids = deque(profile_ids)
+
+    def _request_refill(self, profile_id: int) -> None:
+        # Caller holds self._lock
+        if profile_id not in self._refill_requested:
+            self._refill_requested.add(profile_id)
+            self._refill_queue.append(profile_id)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._refill_queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                profile_id = self._refill_queue.popleft()
+                self._refill_requested.discard(profile_id)
+            try:
+                self._refill(profile_id)
+            except Exception:
+                logger.exception("Refilling the deck of %s failed", profile_id)
+
+    def take(self, profile_id: int, count: int) -> list[int]:
+        """Up to count profile ids to show, fewer once the user ran out of matches"""
+        seen = self.matcher.seen
+        with self._lock:
+            deck = self.decks.get(profile_id)
+            first = deck is None
+            if first:
+                deck = _Deck()
+                self.decks.set(profile_id, deck)
+        if first:
+            # First request of this user: rank synchronously
+            self._refill(profile_id, deck)
+
+        taken: list[int] = []
+        refilled = False
+        while len(taken) < count:
+            with self._lock:
+                batch = [deck.profile_ids.popleft() for _ in range(min(count - len(taken), len(deck.profile_ids)))]
+                deck.served.extend(batch)
+                if len(deck.profile_ids) < self.low_water:
+                    self._request_refill(profile_id)
+            if not batch:
+                if refilled:
+                    break
+                # Swiped faster than the background refill - refill right here
+                self._refill(profile_id, deck)
+                refilled = True
+                continue
+            # Swiped since the deck was ranked (e.g. in another tab)
+            if seen is not None:
+                batch = [other for other, was_seen in zip(batch, seen.seen_mask(profile_id, batch)) if not was_seen]
+            taken.extend(batch)
+        return taken
+
+    def next(self, profile_id: int) -> Optional[int]:
+        """Next profile id to show, or None if there is no one left"""
+        taken = self.take(profile_id, 1)
+        return taken[0] if taken else None
+
+    def discard(self, profile_id: int) -> None:
+        with self._lock:
+            self.decks.pop(profile_id)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
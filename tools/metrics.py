@@ -0,0 +1,194 @@
+"""
+Optional instrumentation with Prometheus text exposition.
+
+Disabled unless SCHOOLTINDER_METRICS=1 is set or enable() is called before the
+database is opened. While disabled, Histogram.time() hands out a shared no-op context
+and connections are opened without any hooks, so the cost is one flag check
+per instrumented call.
+"""
+import bisect
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Iterator
+
+enabled = os.environ.get("SCHOOLTINDER_METRICS") == "1"
+
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_CONTEXT = nullcontext()
+
+
+def enable(on: bool = True) -> None:
+    global enabled
+    enabled = on
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> (per-bucket counts with +Inf last, sum)
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def time(self, *labels: str) -> Any:
+        """Context manager observing its duration, a no-op while metrics are disabled"""
+        if not enabled:
+            return _NULL_CONTEXT
+        return self._timer(labels)
+
+    @contextmanager
+    def _timer(self, labels: tuple[str, ...]) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(counts), total) for labels, (counts, total) in self._values.items())
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+SQL_STATEMENTS = Counter(
+    "sqlite_statements_total", "SQL statements run, including those run by triggers", ("table", "operation")
+)
+SQL_VM_STEPS = Counter("sqlite_vm_instructions_total", "SQLite virtual machine instructions executed")
+SQL_DURATION = Histogram("sqlite_statement_seconds", "Time in execute() per statement", ("table", "operation"))
+MATCHER_PHASE = Histogram("matcher_phase_seconds", "Time per matching phase", ("phase",))
+HTTP_DURATION = Histogram("http_request_seconds", "Request latency per route", ("route", "method", "status"))
+
+REGISTRY: list[Counter | Histogram] = [SQL_STATEMENTS, SQL_VM_STEPS, SQL_DURATION, MATCHER_PHASE, HTTP_DURATION]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_TABLE_PATTERNS = [
+    re.compile(r"^\s*(?:--[^\n]*\n\s*)*(INSERT)\s+(?:OR\s+\w+\s+)?INTO\s+[\"`]?(\w+)", re.IGNORECASE),
+    re.compile(r"^\s*(?:--[^\n]*\n\s*)*(UPDATE)\s+(?:OR\s+\w+\s+)?[\"`]?(\w+)", re.IGNORECASE),
+    re.compile(r"^\s*(?:--[^\n]*\n\s*)*(DELETE)\s+FROM\s+[\"`]?(\w+)", re.IGNORECASE),
+    re.compile(r"^\s*(?:--[^\n]*\n\s*)*(SELECT|WITH)\b.*?\bFROM\s+[\"`]?(\w+)", re.IGNORECASE | re.DOTALL),
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def classify(sql: str) -> tuple[str, str]:
+    """(table, operation) of a statement; the table of a SELECT is its first FROM"""
+    for pattern in _TABLE_PATTERNS:
+        match = pattern.match(sql)
+        if match:
+            operation = match.group(1).upper()
+            return match.group(2), "SELECT" if operation == "WITH" else operation
+    words = sql.split(None, 1)
+    return "", words[0].upper() if words else ""
+
+
+def _trace(sql: str) -> None:
+    # Statements run by triggers are reported as "-- TRIGGER name"
+    if sql.startswith("-- TRIGGER"):
+        SQL_STATEMENTS.inc("", "TRIGGER")
+    else:
+        SQL_STATEMENTS.inc(*classify(sql))
+
+
+# The progress handler runs every PROGRESS_STEPS VM instructions
+PROGRESS_STEPS = 1000
+
+
+def _progress() -> int:
+    SQL_VM_STEPS.inc(amount=PROGRESS_STEPS)
+    return 0
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection timing execute()/executemany() per table and operation"""
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            SQL_DURATION.observe(time.perf_counter() - started, *classify(sql))
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            SQL_DURATION.observe(time.perf_counter() - started, *classify(sql))
+
+
+def connect(path: str, **kwargs: Any) -> sqlite3.Connection:
+    """sqlite3.connect(), with timing and statement tracing while metrics are enabled"""
+    if not enabled:
+        return sqlite3.connect(path, **kwargs)
+    conn = sqlite3.connect(path, factory=InstrumentedConnection, **kwargs)
+    conn.set_trace_callback(_trace)
+    conn.set_progress_handler(_progress, PROGRESS_STEPS)
+    return conn
@@ -1,8 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     user_id: Optional[int]
     username: str
@@ -10,7 +10,7 @@ class User:
     password: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Profile:
     profile_id: Optional[int]
     user_id: int
@@ -22,14 +22,14 @@ class Profile:
     hair_colour: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Picture:
     picture_id: Optional[int]
     profile_id: int
     path: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Preference:
     preference_id: Optional[int]
     profile_id: int
@@ -38,10 +38,30 @@ class Preference:
     sexual_preference: Optional[int]
 
 
-@dataclass
+@dataclass(slots=True)
 class Hobby:
     hobby_id: Optional[int]
     profile_id: int
     hobby_name: Optional[str]
 
 
+@dataclass(slots=True)
+class Swipe:
+    swipe_id: Optional[int]
+    profile_id: int
+    other_profile_id: int
+    result: str
+    created_at: int
+
+
+@dataclass(slots=True)
+class FullProfile:
+    """A profile together with its preferences, hobbies and pictures."""
+    profile: Profile
+    preferences: Optional[Preference] = None
+    hobbies: list[Hobby] = field(default_factory=list)
+    pictures: list[Picture] = field(default_factory=list)
+
+    @property
+    def profile_id(self) -> Optional[int]:
+        return self.profile.profile_id
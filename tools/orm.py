@@ -1,33 +1,281 @@
+import dataclasses
+import functools
+import json
+import operator
 import sqlite3
-from typing import Any, Optional
+import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
+from typing import Any, Callable, ContextManager, Iterable, Iterator, Optional
 
-from tools import models
+from tools import metrics, models
+from tools.cache import ChangeFile, RecordCache
+
+
+class ConnectionPool:
+    """
+    Pool of SQLite connections for a single database file.
+
+    Connections are thread-affine: a thread keeps the connection it borrowed
+    until its outermost borrow ends, so nested ORM calls share one connection,
+    and idle connections are handed back to the thread that used them last.
+    PRAGMAs are applied once when a connection is opened.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 5,
+        timeout: float = 30.0,
+        journal_mode: str = "WAL",
+        synchronous: str = "NORMAL",
+        cache_size: int = -16000,
+        mmap_size: int = 268435456,
+        health_check_interval: float = 30.0,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.health_check_interval = health_check_interval
+        # Idle entries: (connection, ident of the last thread, last release time)
+        self._idle: list[tuple[sqlite3.Connection, int, float]] = []
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _open_connection(self) -> sqlite3.Connection:
+        conn = metrics.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _acquire(self) -> sqlite3.Connection:
+        ident = threading.get_ident()
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError(f"Connection pool for {self.path} is closed.")
+                if self._idle:
+                    index = len(self._idle) - 1
+                    for i, (_, owner, _) in enumerate(self._idle):
+                        if owner == ident:
+                            index = i
+                            break
+                    conn, _, released_at = self._idle.pop(index)
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free connection for {self.path} after {self.timeout}s.")
+                self._cond.wait(remaining)
+
+        if conn is not None:
+            if time.monotonic() - released_at < self.health_check_interval or self._is_healthy(conn):
+                return conn
+            conn.close()
+        try:
+            return self._open_connection()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        with self._cond:
+            if self._closed:
+                self._open -= 1
+                conn.close()
+            else:
+                self._idle.append((conn, threading.get_ident(), time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        conn.close()
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection; the outermost borrow commits on success and rolls
+        back on error. Nested borrows never commit, so ORM calls inside a
+        ``with db.connection()`` block become part of its transaction.
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            self._local.conn = None
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                raise
+            self._release(conn)
+            raise
+        self._local.conn = None
+        self._release(conn)
+
+    def health_check(self) -> int:
+        """Ping all idle connections and drop broken ones. Returns how many were dropped."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        healthy = []
+        for entry in idle:
+            if self._is_healthy(entry[0]):
+                healthy.append(entry)
+            else:
+                self._discard(entry[0])
+        with self._cond:
+            self._idle.extend(healthy)
+            self._cond.notify_all()
+        return len(idle) - len(healthy)
+
+    def close(self) -> None:
+        """Close idle connections; borrowed ones are closed when they are returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            conn.close()
+
+
+def _change_log_triggers(tables: Iterable[str]) -> list[str]:
+    """Triggers logging the profile_id of every write to the given tables"""
+    statements = []
+    for table in tables:
+        name = table.lower()
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS trg_{name}_insert AFTER INSERT ON {table} BEGIN "
+            "INSERT INTO ProfileChange (profile_id) VALUES (NEW.profile_id); END",
+            f"CREATE TRIGGER IF NOT EXISTS trg_{name}_update AFTER UPDATE ON {table} BEGIN "
+            "INSERT INTO ProfileChange (profile_id) VALUES (NEW.profile_id); "
+            "INSERT INTO ProfileChange (profile_id) SELECT OLD.profile_id WHERE OLD.profile_id != NEW.profile_id; END",
+            f"CREATE TRIGGER IF NOT EXISTS trg_{name}_delete AFTER DELETE ON {table} BEGIN "
+            "INSERT INTO ProfileChange (profile_id) VALUES (OLD.profile_id); END",
+        ]
+    return statements
+
+
+def _login_triggers() -> list[str]:
+    """Triggers rejecting a username that is another user's email and vice versa"""
+    taken = (
+        "WHEN EXISTS (SELECT 1 FROM User WHERE (email = NEW.username OR username = NEW.email) "
+        "AND user_id IS NOT NEW.user_id) BEGIN SELECT RAISE(ABORT, 'login already taken'); END"
+    )
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_user_login_insert BEFORE INSERT ON User {taken}",
+        f"CREATE TRIGGER IF NOT EXISTS trg_user_login_update BEFORE UPDATE OF username, email ON User {taken}",
+    ]
+
+
+def _check_unique_logins(conn: sqlite3.Connection) -> None:
+    """Raise, listing them, while users share a username or an email, or one user's username is another's email"""
+    conflicts = [
+        f"username {name!r}: users {users}"
+        for name, users in conn.execute(
+            "SELECT username, group_concat(user_id, ', ') FROM (SELECT username, user_id FROM User ORDER BY user_id) "
+            "GROUP BY username HAVING COUNT(*) > 1 ORDER BY username"
+        )
+    ]
+    conflicts += [
+        f"email {email!r}: users {users}"
+        for email, users in conn.execute(
+            "SELECT email, group_concat(user_id, ', ') FROM (SELECT email, user_id FROM User ORDER BY user_id) "
+            "GROUP BY email HAVING COUNT(*) > 1 ORDER BY email"
+        )
+    ]
+    conflicts += [
+        f"{login!r}: username of user {user_id}, email of user {other_id}"
+        for login, user_id, other_id in conn.execute(
+            "SELECT named.username, named.user_id, other.user_id FROM User AS named "
+            "JOIN User AS other ON other.email = named.username AND other.user_id != named.user_id "
+            "ORDER BY named.user_id, other.user_id"
+        )
+    ]
+    if conflicts:
+        shown = conflicts[:20]
+        if len(conflicts) > len(shown):
+            shown.append(f"... and {len(conflicts) - len(shown)} more")
+        raise sqlite3.IntegrityError(
+            "Logins must be unique from schema version 6 on. Change these users, then migrate again:\n  "
+            + "\n  ".join(shown)
+        )
 
 
 class Database:
     """
     Database:
-        - First Iteration using a sqlite connection to the database
-        - Second Iteration using Connection Pooling if we still got time. 
+        - Owns one ConnectionPool per database file, shared by all ORM classes
+          and by every Database for that file; the first one that opens the pool
+          decides its settings, and the last one to close() closes it.
+        - Extra keyword arguments are passed on to ConnectionPool
+          (journal_mode, synchronous, cache_size, mmap_size, ...).
+        - The schema is versioned through ``PRAGMA user_version``; ``migrate()``
+          applies every entry of ``migrations`` that the file has not seen yet.
     """
     default_path = "schooltinder.db"
+    _pools: dict[str, ConnectionPool] = {}
+    # Number of open Database objects per pool
+    _pool_owners: dict[ConnectionPool, int] = {}
+    _pools_lock = threading.Lock()
 
-    def __init__(self, path: str):
-        self.path = path
-        Database.default_path = path
-        self.scheme = """
--- Aktiviert die Unterstützung für Fremdschlüssel
-PRAGMA foreign_keys = ON;
-
--- Tabelle: User
+    # Migration N (1-based) brings the schema from user_version N-1 to N.
+    # Only ever append new migrations, never edit released ones. Besides SQL,
+    # a migration may hold callables, which get the connection.
+    migrations: list[list[str | Callable[[sqlite3.Connection], None]]] = [
+        # 1: Grundschema
+        [
+            # Tabelle: User
+            """
 CREATE TABLE IF NOT EXISTS User (
     user_id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT NOT NULL,
     email TEXT NOT NULL,
     password TEXT NOT NULL
-);
-
--- Tabelle: Profile
+)""",
+            # Tabelle: Profile
+            """
 CREATE TABLE IF NOT EXISTS Profile (
     profile_id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL UNIQUE,
@@ -38,17 +286,17 @@ CREATE TABLE IF NOT EXISTS Profile (
     home_address TEXT NOT NULL,
     hair_colour TEXT NOT NULL,
     FOREIGN KEY (user_id) REFERENCES User(user_id) ON DELETE CASCADE
-);
-
--- Tabelle: Pictures
+)""",
+            # Tabelle: Pictures
+            """
 CREATE TABLE IF NOT EXISTS Pictures (
     picture_id INTEGER PRIMARY KEY AUTOINCREMENT,
     profile_id INTEGER NOT NULL,
     path TEXT NOT NULL,
     FOREIGN KEY (profile_id) REFERENCES Profile(profile_id) ON DELETE CASCADE
-);
-
--- Tabelle: Preferences
+)""",
+            # Tabelle: Preferences
+            """
 CREATE TABLE IF NOT EXISTS Preferences (
     preference_id INTEGER PRIMARY KEY AUTOINCREMENT,
     profile_id INTEGER NOT NULL,
@@ -56,23 +304,342 @@ CREATE TABLE IF NOT EXISTS Preferences (
     upper_age_bound INTEGER NOT NULL,
     sexual_preference INTEGER,
     FOREIGN KEY (profile_id) REFERENCES Profile(profile_id) ON DELETE CASCADE
-);
-
--- Tabelle: Hobby
+)""",
+            # Tabelle: Hobby
+            """
 CREATE TABLE IF NOT EXISTS Hobby (
     hobby_id INTEGER PRIMARY KEY AUTOINCREMENT,
     profile_id INTEGER NOT NULL,
     hobby_name TEXT,
     FOREIGN KEY (profile_id) REFERENCES Profile(profile_id) ON DELETE CASCADE
-);
+)""",
+        ],
+        # 2: Covering indexes for the login lookups and the per-profile child tables
+        [
+            "CREATE INDEX IF NOT EXISTS idx_user_username ON User (username, email, password)",
+            "CREATE INDEX IF NOT EXISTS idx_user_email ON User (email, username, password)",
+            "CREATE INDEX IF NOT EXISTS idx_pictures_profile ON Pictures (profile_id, path)",
+            "CREATE INDEX IF NOT EXISTS idx_preferences_profile ON Preferences "
+            "(profile_id, lower_age_bound, upper_age_bound, sexual_preference)",
+            "CREATE INDEX IF NOT EXISTS idx_hobby_profile ON Hobby (profile_id, hobby_name)",
+            "ANALYZE",
+        ],
+        # 3: Tabelle Swipe - one row per (profile, other profile), the last swipe wins
+        [
+            """
+CREATE TABLE IF NOT EXISTS Swipe (
+    swipe_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile_id INTEGER NOT NULL,
+    other_profile_id INTEGER NOT NULL,
+    result TEXT NOT NULL CHECK (result IN ('success', 'denial')),
+    created_at INTEGER NOT NULL,
+    FOREIGN KEY (profile_id) REFERENCES Profile(profile_id) ON DELETE CASCADE,
+    FOREIGN KEY (other_profile_id) REFERENCES Profile(profile_id) ON DELETE CASCADE
+)""",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_swipe_pair ON Swipe (profile_id, other_profile_id)",
+            "CREATE INDEX IF NOT EXISTS idx_swipe_other ON Swipe (other_profile_id)",
+        ],
+        # 4: Tabelle ProfileChange - change log of every profile the matcher indexes
+        [
+            """
+CREATE TABLE IF NOT EXISTS ProfileChange (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile_id INTEGER NOT NULL
+)""",
+            *_change_log_triggers(["Profile", "Preferences", "Hobby", "Pictures"]),
+        ],
+        # 5: Tabelle ProfileChangeReader - how far each matcher (and snapshot) applied the log
+        [
+            """
+CREATE TABLE IF NOT EXISTS ProfileChangeReader (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+)""",
+        ],
+        # 6: Unique logins - get_by_login (and the user cache) find at most one user.
+        # Fails, listing them, while users already share a login; stored rows are never changed.
+        # The unique indexes replace the covering ones from migration 2.
+        [
+            _check_unique_logins,
+            "DROP INDEX IF EXISTS idx_user_username",
+            "DROP INDEX IF EXISTS idx_user_email",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_username_unique ON User (username)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_email_unique ON User (email)",
+            *_login_triggers(),
+        ],
+        # 7: Tabelle DatabaseInfo - a random id per database, so snapshots notice a replaced file
+        [
+            """
+CREATE TABLE IF NOT EXISTS DatabaseInfo (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)""",
+            "INSERT OR IGNORE INTO DatabaseInfo (name, value) VALUES ('database_id', lower(hex(randomblob(16))))",
+        ],
+    ]
+
+    def __init__(self, path: str, pool_size: int = 5, **pool_options: Any):
+        self.path = path
+        Database.default_path = path
+        with Database._pools_lock:
+            pool = Database._pools.get(path)
+            if pool is None or pool.closed:
+                pool = ConnectionPool(path, size=pool_size, **pool_options)
+                Database._pools[path] = pool
+            Database._pool_owners[pool] = Database._pool_owners.get(pool, 0) + 1
+        self.pool = pool
+        self._closed = False
+
+    @property
+    def schema_version(self) -> int:
+        with self.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self, target: Optional[int] = None) -> int:
+        """
+        Upgrade the database in place to ``target`` (default: latest) and return
+        the resulting version. Every migration runs in its own write transaction:
+        if one fails, the database keeps the versions applied before it, and
+        concurrent callers simply find the work already done.
         """
+        target = len(self.migrations) if target is None else target
+        if not 0 <= target <= len(self.migrations):
+            raise ValueError(f"Unknown schema version: {target}")
+        with self.connection() as conn:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version > len(self.migrations):
+                    conn.rollback()
+                    raise RuntimeError(
+                        f"Database {self.path} has schema version {version}, "
+                        f"newer than this code ({len(self.migrations)})."
+                    )
+                if version >= target:
+                    conn.rollback()
+                    return version
+                for statement in self.migrations[version]:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
 
-    def initialize_database(self):
-        conn = sqlite3.connect(self.path)
-        cursor = conn.cursor()
-        cursor.executescript(self.scheme)
-        conn.commit()
-        conn.close()
+    @property
+    def database_id(self) -> str:
+        """Random id the database got when its schema was created"""
+        with self.connection() as conn:
+            return conn.execute("SELECT value FROM DatabaseInfo WHERE name = 'database_id'").fetchone()[0]
+
+    def initialize_database(self) -> int:
+        return self.migrate()
+
+    def optimize(self) -> None:
+        """Refresh planner statistics, e.g. after a bulk load."""
+        with self.connection() as conn:
+            conn.execute("ANALYZE")
+
+    def connection(self) -> ContextManager[sqlite3.Connection]:
+        return self.pool.connection()
+
+    def close(self) -> None:
+        """Release the pool; it is closed once no other Database uses it."""
+        with Database._pools_lock:
+            if self._closed:
+                return
+            self._closed = True
+            owners = Database._pool_owners.pop(self.pool) - 1
+            if owners:
+                Database._pool_owners[self.pool] = owners
+                return
+            if Database._pools.get(self.path) is self.pool:
+                del Database._pools[self.path]
+        self.pool.close()
+
+    def get_profile(self, profile_id: int) -> Optional[models.FullProfile]:
+        profiles = self.get_profiles([profile_id])
+        return profiles[0] if profiles else None
+
+    def change_log_bounds(self) -> tuple[Optional[int], int]:
+        """
+        (oldest logged seq, last seq ever handed out) of the ProfileChange log.
+        The oldest is None if the log is empty.
+        """
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT (SELECT MIN(seq) FROM ProfileChange), "
+                "(SELECT seq FROM sqlite_sequence WHERE name = 'ProfileChange')"
+            ).fetchone()
+        return row[0], row[1] or 0
+
+    def profile_changes(self, after_seq: int, limit: int = 10_000) -> tuple[int, list[int]]:
+        """
+        Profile ids changed after ``after_seq`` (up to ``limit`` log entries),
+        each once, and the seq of the last entry read.
+        """
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, profile_id FROM ProfileChange WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+            ).fetchall()
+        if not rows:
+            return after_seq, []
+        return rows[-1][0], list(dict.fromkeys(row[1] for row in rows))
+
+    def prune_profile_changes(self, up_to_seq: int) -> int:
+        """Delete log entries every reader has applied; returns the number deleted"""
+        with self.connection() as conn:
+            return conn.execute("DELETE FROM ProfileChange WHERE seq <= ?", (up_to_seq,)).rowcount
+
+    def record_profile_changes_read(self, reader: str, seq: int) -> None:
+        """Remember that ``reader`` has applied the change log up to seq"""
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO ProfileChangeReader (name, seq, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at",
+                (reader, seq, int(time.time())),
+            )
+
+    def forget_profile_changes_reader(self, reader: str) -> None:
+        """Stop ``reader`` from holding back pruning, e.g. when its matcher is closed"""
+        with self.connection() as conn:
+            conn.execute("DELETE FROM ProfileChangeReader WHERE name = ?", (reader,))
+
+    def prune_read_profile_changes(self, reader_ttl: float = 24 * 3600) -> int:
+        """
+        Delete the log entries every reader has applied. Readers that did not
+        report for ``reader_ttl`` seconds are forgotten first; if one comes
+        back, it finds the log pruned past its seq and rebuilds. Returns the
+        number of entries deleted.
+        """
+        with self.connection() as conn:
+            conn.execute("DELETE FROM ProfileChangeReader WHERE updated_at < ?", (int(time.time() - reader_ttl),))
+            up_to_seq = conn.execute("SELECT MIN(seq) FROM ProfileChangeReader").fetchone()[0]
+            if up_to_seq is None:
+                return 0
+            return self.prune_profile_changes(up_to_seq)
+
+    def get_profiles(self, profile_ids: Iterable[int]) -> list[models.FullProfile]:
+        """
+        Load full profiles for ``profile_ids`` in four queries, regardless of how
+        many ids are given. Results follow the order of ``profile_ids``; unknown
+        ids are skipped.
+        """
+        ordered_ids = list(dict.fromkeys(int(profile_id) for profile_id in profile_ids))
+        if not ordered_ids:
+            return []
+        # json_each() passes the whole id list as one parameter, so the query
+        # text (and its cached plan) is the same for any number of ids.
+        with self.connection() as conn:
+            loaded = self._load_profiles(
+                conn, "profile_id IN (SELECT value FROM json_each(?))", (json.dumps(ordered_ids),)
+            )
+        return [loaded[profile_id] for profile_id in ordered_ids if profile_id in loaded]
+
+    def existing_profile_ids(self, profile_ids: Iterable[int]) -> set[int]:
+        """The given ids that belong to a profile, in one query"""
+        ids = list({int(profile_id) for profile_id in profile_ids})
+        if not ids:
+            return set()
+        with self.connection() as conn:
+            return {
+                row[0] for row in _tuples(conn.execute(
+                    "SELECT profile_id FROM Profile WHERE profile_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(ids),),
+                ))
+            }
+
+    def iter_profiles(
+        self, chunk_size: int = 1000, after_id: Optional[int] = None, until_id: Optional[int] = None
+    ) -> Iterator[models.FullProfile]:
+        """
+        Stream full profiles in profile_id order, four queries per chunk.
+        ``after_id``/``until_id`` restrict the stream to ``after_id < profile_id <= until_id``.
+        """
+        after_id = -1 if after_id is None else after_id
+        until_id = 2**63 - 1 if until_id is None else until_id
+        page_sql = Database._profile_queries("profile_id > ? AND profile_id <= ?")[0] + " LIMIT ?"
+        _, child_sql = Database._profile_queries("profile_id BETWEEN ? AND ?")
+        Profile, FullProfile = models.Profile, models.FullProfile
+        while True:
+            with self.connection() as conn:
+                profiles = {
+                    row[0]: FullProfile(Profile(*row))
+                    for row in _tuples(conn.execute(page_sql, (after_id, until_id, chunk_size)))
+                }
+                if not profiles:
+                    return
+                # The chunk's children: the id range its profiles span
+                bounds = (next(iter(profiles)), next(reversed(profiles)))
+                self._load_children(conn, profiles, child_sql, bounds)
+            yield from profiles.values()
+            after_id = bounds[1]
+
+    def get_all_profiles(self) -> Iterator[models.FullProfile]:
+        return self.iter_profiles()
+
+    # Explicit column lists in model field order, so rows unpack into the models
+    _PROFILE_COLUMNS = ", ".join(f.name for f in dataclasses.fields(models.Profile))
+    _CHILD_TABLES = [
+        # (table, model, order column); profile_id is the second column of each
+        ("Preferences", models.Preference, "preference_id"),
+        ("Hobby", models.Hobby, "hobby_id"),
+        ("Pictures", models.Picture, "picture_id"),
+    ]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _profile_queries(where: str) -> tuple[str, list[tuple[str, type]]]:
+        profile_sql = f"SELECT {Database._PROFILE_COLUMNS} FROM Profile WHERE {where} ORDER BY profile_id"
+        child_sql = [
+            (
+                f"SELECT {', '.join(f.name for f in dataclasses.fields(model))} FROM {table} "
+                f"WHERE {where} ORDER BY profile_id, {order}",
+                model,
+            )
+            for table, model, order in Database._CHILD_TABLES
+        ]
+        return profile_sql, child_sql
+
+    @staticmethod
+    def _load_profiles(
+        conn: sqlite3.Connection, where: str, params: tuple[Any, ...]
+    ) -> dict[int, models.FullProfile]:
+        profile_sql, child_sql = Database._profile_queries(where)
+        Profile, FullProfile = models.Profile, models.FullProfile
+        profiles = {row[0]: FullProfile(Profile(*row)) for row in _tuples(conn.execute(profile_sql, params))}
+        Database._load_children(conn, profiles, child_sql, params)
+        return profiles
+
+    @staticmethod
+    def _load_children(
+        conn: sqlite3.Connection, profiles: dict[int, models.FullProfile],
+        child_sql: list[tuple[str, type]], params: tuple[Any, ...],
+    ) -> None:
+        """Fill in preferences, hobbies and pictures of profiles, one query per table"""
+        preferences_sql, hobbies_sql, pictures_sql = child_sql
+        # Ascending preference_id: the newest preferences row wins.
+        sql, Preference = preferences_sql
+        for row in _tuples(conn.execute(sql, params)):
+            full = profiles.get(row[1])
+            if full is not None:
+                full.preferences = Preference(*row)
+        for (sql, model), attribute in ((hobbies_sql, "hobbies"), (pictures_sql, "pictures")):
+            for row in _tuples(conn.execute(sql, params)):
+                full = profiles.get(row[1])
+                if full is not None:
+                    getattr(full, attribute).append(model(*row))
+
+    @classmethod
+    def get_pool(cls, path: str) -> ConnectionPool:
+        """Return the open pool for ``path``, creating one with default settings if needed."""
+        with cls._pools_lock:
+            pool = cls._pools.get(path)
+            if pool is None or pool.closed:
+                pool = ConnectionPool(path)
+                cls._pools[path] = pool
+            return pool
 
     @classmethod
     def set_default_path(cls, path: str) -> None:
@@ -83,15 +650,84 @@ CREATE TABLE IF NOT EXISTS Hobby (
         return cls.default_path
 
 
+def _tuples(cursor: sqlite3.Cursor) -> sqlite3.Cursor:
+    """Fetch plain tuples from cursor instead of sqlite3.Row objects"""
+    cursor.row_factory = None
+    return cursor
+
+
+def _row_constructor(cls: type) -> Callable[[str, Any], Any]:
+    """
+    Build ``from_row(db_path, row)`` for cls: it creates an instance straight
+    from a (pk, *columns) row with one unpacking assignment, skipping
+    __init__, keyword arguments and per-field setattr() calls.
+    """
+    # Generated because the attribute names are only known per class: a
+    # generic loop of setattr(obj, name, value) calls is about three times
+    # slower than one compiled unpacking assignment of all slots (and the
+    # keyword __init__ it replaces is slower still).
+    targets = "".join(f"obj.{name}, " for name in cls._fields)
+    source = (
+        "def from_row(db_path, row):\n"
+        "    obj = new(cls)\n"
+        "    obj.db_path = db_path\n"
+        f"    {targets}= row\n"
+        "    return obj\n"
+    )
+    namespace = {"new": object.__new__, "cls": cls}
+    exec(source, namespace)
+    return namespace["from_row"]
+
+
+@functools.lru_cache(maxsize=256)
+def _insert_sql(table: str, names: tuple[str, ...], rows: int = 1, returning: str = "") -> str:
+    placeholders = "(" + ", ".join(["?"] * len(names)) + ")"
+    sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES {', '.join([placeholders] * rows)}"
+    return f"{sql} RETURNING {returning}" if returning else sql
+
+
+@functools.lru_cache(maxsize=256)
+def _update_sql(table: str, pk_field: str, names: tuple[str, ...]) -> str:
+    return f"UPDATE {table} SET {', '.join(f'{name} = ?' for name in names)} WHERE {pk_field} = ?"
+
+
 class _OrmBase:
     table: str = ""
     pk_field: str = ""
     columns: list[str] = []
     model_cls: Optional[type] = None
+    # Subclasses list their fields in __slots__ as well: no per-instance __dict__
+    __slots__ = ("db_path",)
+
+    # Set per subclass by __init_subclass__
+    _fields: tuple[str, ...] = ()
+    _sql: dict[str, str] = {}
+    # Extra single-row lookups: query name -> WHERE clause, prepared like get_by_id
+    _lookups: dict[str, str] = {}
+    # Columns with a UNIQUE index the row cache can answer lookups by, next to the primary key
+    cache_aliases: tuple[str, ...] = ()
+    # Set by enable_cache(): the read-through cache and the database it caches
+    _cache: Optional[RecordCache] = None
+    _cache_path: Optional[str] = None
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._fields = (cls.pk_field, *cls.columns)
+        cls._field_values = operator.attrgetter(*cls._fields)
+        cls._from_row = staticmethod(_row_constructor(cls))
+        select = f"SELECT {', '.join(cls._fields)} FROM {cls.table}"
+        cls._sql = {
+            "select": select,
+            "get_by_id": f"{select} WHERE {cls.pk_field} = ?",
+            "page": f"{select} WHERE {cls.pk_field} > ? ORDER BY {cls.pk_field} LIMIT ?",
+            "delete_by_id": f"DELETE FROM {cls.table} WHERE {cls.pk_field} = ?",
+        }
+        for name, where in cls._lookups.items():
+            cls._sql[name] = f"{select} WHERE {where}"
 
     def __init__(self, db_path: Optional[str] = None, **fields: Any) -> None:
         self.db_path = self._resolve_db_path(db_path)
-        for name in [self.pk_field, *self.columns]:
+        for name in self._fields:
             setattr(self, name, fields.get(name))
 
     @classmethod
@@ -103,19 +739,75 @@ class _OrmBase:
         raise ValueError("Database path is required. Set Database.default_path first.")
 
     @classmethod
-    def _connect(cls, db_path: str) -> sqlite3.Connection:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
-        return conn
+    def _connect(cls, db_path: str) -> ContextManager[sqlite3.Connection]:
+        return Database.get_pool(db_path).connection()
 
     @classmethod
-    def _filter_fields(cls, fields: dict[str, Any]) -> dict[str, Any]:
-        return {name: value for name, value in fields.items() if name in cls.columns}
+    def enable_cache(
+        cls,
+        db_path: Optional[str] = None,
+        max_entries: int = 10_000,
+        ttl: Optional[float] = None,
+        notify_path: Optional[str] = None,
+    ) -> RecordCache:
+        """
+        Put a read-through cache in front of get_by_id() and the lookups by
+        cache_aliases for the database at db_path. Writes through this class
+        invalidate it. Processes sharing a ``notify_path`` file also invalidate
+        each other's caches; without it, writes from other processes (and raw
+        SQL) only become visible once an entry expires after ``ttl`` seconds.
+        """
+        cls._cache_path = cls._resolve_db_path(db_path)
+        cls._cache = RecordCache(
+            max_entries,
+            ttl,
+            {name: cls._fields.index(name) for name in cls.cache_aliases},
+            ChangeFile(notify_path) if notify_path else None,
+        )
+        return cls._cache
 
     @classmethod
-    def _row_to_instance(cls, db_path: str, row: sqlite3.Row) -> "_OrmBase":
-        return cls(db_path, **dict(row))
+    def disable_cache(cls) -> None:
+        cls._cache = None
+        cls._cache_path = None
+
+    @classmethod
+    def _cache_for(cls, db_path: str) -> Optional[RecordCache]:
+        cache = cls._cache
+        return cache if cache is not None and db_path == cls._cache_path else None
+
+    @classmethod
+    def _invalidate(cls, db_path: str, record_ids: Iterable[Any]) -> None:
+        cache = cls._cache_for(db_path)
+        if cache is not None:
+            cache.invalidate(record_id for record_id in record_ids if record_id is not None)
+
+    @classmethod
+    def _fetch_one(
+        cls,
+        db_path: str,
+        sql: str,
+        params: tuple,
+        cached: Callable[[RecordCache], Optional[tuple]],
+    ) -> Optional["_OrmBase"]:
+        """Single-row query, answered by cached(cache) first while the cache is enabled"""
+        cache = cls._cache_for(db_path)
+        if cache is not None:
+            row = cached(cache)
+            if row is not None:
+                return cls._from_row(db_path, row)
+            token = cache.token()
+        with cls._connect(db_path) as conn:
+            row = _tuples(conn.execute(sql, params)).fetchone()
+        if row is None:
+            return None
+        if cache is not None:
+            cache.put(row, token)
+        return cls._from_row(db_path, row)
+
+    @classmethod
+    def _filter_fields(cls, fields: dict[str, Any]) -> dict[str, Any]:
+        return {name: value for name, value in fields.items() if name in cls.columns}
 
     @classmethod
     def create(cls, db_path: Optional[str] = None, **fields: Any) -> Optional["_OrmBase"]:
@@ -123,37 +815,25 @@ class _OrmBase:
         clean_fields = cls._filter_fields(fields)
         if not clean_fields:
             raise ValueError("No fields provided for create().")
-        columns = ", ".join(clean_fields.keys())
-        placeholders = ", ".join(["?"] * len(clean_fields))
         values = list(clean_fields.values())
         with cls._connect(db_path) as conn:
-            cursor = conn.execute(
-                f"INSERT INTO {cls.table} ({columns}) VALUES ({placeholders})",
-                values,
-            )
-            conn.commit()
+            cursor = conn.execute(_insert_sql(cls.table, tuple(clean_fields)), values)
             new_id = cursor.lastrowid
         return cls.get_by_id(db_path, new_id)
 
     @classmethod
     def get_by_id(cls, db_path: Optional[str] = None, record_id: int = 0) -> Optional["_OrmBase"]:
         db_path = cls._resolve_db_path(db_path)
-        with cls._connect(db_path) as conn:
-            cursor = conn.execute(
-                f"SELECT * FROM {cls.table} WHERE {cls.pk_field} = ?",
-                (record_id,),
-            )
-            row = cursor.fetchone()
-        if row is None:
-            return None
-        return cls._row_to_instance(db_path, row)
+        return cls._fetch_one(
+            db_path, cls._sql["get_by_id"], (record_id,), lambda cache: cache.get(record_id)
+        )
 
     @classmethod
     def list_all(
         cls, db_path: Optional[str] = None, limit: Optional[int] = None, offset: Optional[int] = None
     ) -> list["_OrmBase"]:
         db_path = cls._resolve_db_path(db_path)
-        query = f"SELECT * FROM {cls.table}"
+        query = cls._sql["select"]
         params: list[Any] = []
         if limit is not None:
             query += " LIMIT ?"
@@ -162,9 +842,44 @@ class _OrmBase:
                 query += " OFFSET ?"
                 params.append(offset)
         with cls._connect(db_path) as conn:
-            cursor = conn.execute(query, params)
-            rows = cursor.fetchall()
-        return [cls._row_to_instance(db_path, row) for row in rows]
+            rows = _tuples(conn.execute(query, params)).fetchall()
+        from_row = cls._from_row
+        return [from_row(db_path, row) for row in rows]
+
+    @classmethod
+    def iter_all(cls, db_path: Optional[str] = None, chunk_size: int = 1000) -> Iterator["_OrmBase"]:
+        """
+        Stream every row in primary key order, fetching ``chunk_size`` rows at a time.
+        Each chunk is a keyset query on its own borrow, so no connection (or
+        transaction) is held while the caller handles the rows.
+        """
+        db_path = cls._resolve_db_path(db_path)
+        from_row = cls._from_row
+        after_id = -1
+        while True:
+            with cls._connect(db_path) as conn:
+                rows = _tuples(conn.execute(cls._sql["page"], (after_id, chunk_size))).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield from_row(db_path, row)
+            after_id = rows[-1][0]
+
+    @classmethod
+    def page(
+        cls, db_path: Optional[str] = None, after_id: Optional[int] = None, limit: int = 100
+    ) -> list["_OrmBase"]:
+        """
+        Keyset pagination: up to ``limit`` rows whose primary key is greater than
+        ``after_id``. Pass the last id of a page to get the next one.
+        """
+        db_path = cls._resolve_db_path(db_path)
+        with cls._connect(db_path) as conn:
+            rows = _tuples(
+                conn.execute(cls._sql["page"], (after_id if after_id is not None else -1, limit))
+            ).fetchall()
+        from_row = cls._from_row
+        return [from_row(db_path, row) for row in rows]
 
     @classmethod
     def update_by_id(
@@ -174,32 +889,120 @@ class _OrmBase:
         clean_fields = cls._filter_fields(fields)
         if not clean_fields:
             return cls.get_by_id(db_path, record_id)
-        assignments = ", ".join([f"{name} = ?" for name in clean_fields])
         values = list(clean_fields.values()) + [record_id]
         with cls._connect(db_path) as conn:
-            conn.execute(
-                f"UPDATE {cls.table} SET {assignments} WHERE {cls.pk_field} = ?",
-                values,
-            )
-            conn.commit()
+            conn.execute(_update_sql(cls.table, cls.pk_field, tuple(clean_fields)), values)
+        cls._invalidate(db_path, [record_id])
         return cls.get_by_id(db_path, record_id)
 
     @classmethod
     def delete_by_id(cls, db_path: Optional[str] = None, record_id: int = 0) -> bool:
         db_path = cls._resolve_db_path(db_path)
         with cls._connect(db_path) as conn:
-            cursor = conn.execute(
-                f"DELETE FROM {cls.table} WHERE {cls.pk_field} = ?",
-                (record_id,),
-            )
-            conn.commit()
+            cursor = conn.execute(cls._sql["delete_by_id"], (record_id,))
+        cls._invalidate(db_path, [record_id])
         return cursor.rowcount > 0
 
+    @classmethod
+    def _record_fields(cls, record: Any) -> dict[str, Any]:
+        """Accept a dict, an ORM instance or a ``tools.models`` dataclass."""
+        if isinstance(record, dict):
+            return record
+        return {name: getattr(record, name, None) for name in cls._fields}
+
+    @classmethod
+    def _column_key(cls, fields: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(name for name in cls.columns if name in fields)
+
+    @classmethod
+    def create_many(
+        cls, db_path: Optional[str] = None, records: Iterable[Any] = (), fetch: bool = True
+    ) -> list["_OrmBase"]:
+        """
+        Insert many records in one transaction and return them in input order.
+
+        Uses multi-row ``INSERT ... RETURNING`` statements because ``executemany``
+        discards returned rows. With ``fetch=False`` only the new ids are returned
+        and the instances are built from the given fields.
+        """
+        db_path = cls._resolve_db_path(db_path)
+        rows = [cls._filter_fields(cls._record_fields(record)) for record in records]
+        if not rows:
+            return []
+        if not all(rows):
+            raise ValueError("No fields provided for create_many().")
+        returning = ", ".join(cls._fields) if fetch else cls.pk_field
+        created: list[_OrmBase] = []
+        with cls._connect(db_path) as conn:
+            max_variables = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+            for names, group in groupby(rows, key=cls._column_key):
+                group = list(group)
+                chunk_size = max(1, max_variables // len(names))
+                for start in range(0, len(group), chunk_size):
+                    chunk = group[start:start + chunk_size]
+                    values = [fields[name] for fields in chunk for name in names]
+                    # Only the last chunk of a group has a different size, so
+                    # few distinct statements end up in the caches
+                    cursor = conn.execute(_insert_sql(cls.table, names, len(chunk), returning), values)
+                    # RETURNING order is unspecified; new ids follow insertion order.
+                    returned = sorted(_tuples(cursor).fetchall())
+                    if fetch:
+                        created.extend(cls._from_row(db_path, row) for row in returned)
+                    else:
+                        created.extend(
+                            cls(db_path, **{**fields, cls.pk_field: row[0]})
+                            for fields, row in zip(chunk, returned)
+                        )
+        return created
+
+    @classmethod
+    def update_many(cls, db_path: Optional[str] = None, records: Iterable[Any] = ()) -> int:
+        """
+        Update many records in one transaction. Every record needs its primary key;
+        only the columns present in a record are written. Returns the number of
+        updated rows.
+        """
+        db_path = cls._resolve_db_path(db_path)
+        rows = []
+        for record in records:
+            fields = cls._record_fields(record)
+            if fields.get(cls.pk_field) is None:
+                raise ValueError(f"update_many() requires {cls.pk_field} on every record.")
+            rows.append(fields)
+        updated = 0
+        with cls._connect(db_path) as conn:
+            for names, group in groupby(rows, key=cls._column_key):
+                if not names:
+                    continue
+                cursor = conn.executemany(
+                    _update_sql(cls.table, cls.pk_field, names),
+                    ([*(fields[name] for name in names), fields[cls.pk_field]] for fields in group),
+                )
+                updated += cursor.rowcount
+        cls._invalidate(db_path, (fields[cls.pk_field] for fields in rows))
+        return updated
+
+    @classmethod
+    def delete_many(cls, db_path: Optional[str] = None, records: Iterable[Any] = ()) -> int:
+        """Delete many records (ids, dicts or models) in one transaction. Returns the number deleted."""
+        db_path = cls._resolve_db_path(db_path)
+        record_ids = [
+            record if isinstance(record, int) else cls._record_fields(record).get(cls.pk_field)
+            for record in records
+        ]
+        with cls._connect(db_path) as conn:
+            cursor = conn.executemany(
+                cls._sql["delete_by_id"],
+                ((record_id,) for record_id in record_ids if record_id is not None),
+            )
+        cls._invalidate(db_path, record_ids)
+        return max(cursor.rowcount, 0)
+
     def _as_fields(self) -> dict[str, Any]:
         return {name: getattr(self, name) for name in self.columns}
 
     def _update_from_instance(self, other: "_OrmBase") -> None:
-        for name in [self.pk_field, *self.columns]:
+        for name in self._fields:
             setattr(self, name, getattr(other, name))
 
     def create_instance(self) -> Optional["_OrmBase"]:
@@ -254,14 +1057,13 @@ class _OrmBase:
     def to_model(self) -> Optional[Any]:
         if self.model_cls is None:
             return None
-        payload = {name: getattr(self, name) for name in [self.pk_field, *self.columns]}
-        return self.model_cls(**payload)
+        # Model fields are declared in the same order as pk_field, *columns
+        return self.model_cls(*self._field_values(self))
 
     @classmethod
     def from_model(cls, model_obj: Any, db_path: Optional[str] = None) -> "_OrmBase":
         db_path = cls._resolve_db_path(db_path)
-        payload = {name: getattr(model_obj, name) for name in [cls.pk_field, *cls.columns]}
-        return cls(db_path, **payload)
+        return cls._from_row(db_path, cls._field_values(model_obj))
 
 
 class User(_OrmBase):
@@ -269,45 +1071,37 @@ class User(_OrmBase):
     pk_field = "user_id"
     columns = ["username", "email", "password"]
     model_cls = models.User
+    __slots__ = (pk_field, *columns)
+    _lookups = {
+        "get_by_username": "username = ?",
+        "get_by_email": "email = ?",
+        "get_by_login": "username = ? OR email = ?",
+    }
+    # Unique since migration 6, which also keeps a login from being one
+    # user's username and another's email, so get_by_login finds at most one
+    # user and the order the cache checks the aliases in does not matter
+    cache_aliases = ("username", "email")
 
     @classmethod
     def get_by_username(cls, username: str) -> Optional["User"]:
-        db_path = cls._resolve_db_path(None)
-        with cls._connect(db_path) as conn:
-            cursor = conn.execute(
-                f"SELECT * FROM {cls.table} WHERE username = ?",
-                (username,),
-            )
-            row = cursor.fetchone()
-        if row is None:
-            return None
-        return cls._row_to_instance(db_path, row)
+        return cls._fetch_one(
+            cls._resolve_db_path(None), cls._sql["get_by_username"], (username,),
+            lambda cache: cache.get_alias("username", username),
+        )
 
     @classmethod
     def get_by_email(cls, email: str) -> Optional["User"]:
-        db_path = cls._resolve_db_path(None)
-        with cls._connect(db_path) as conn:
-            cursor = conn.execute(
-                f"SELECT * FROM {cls.table} WHERE email = ?",
-                (email,),
-            )
-            row = cursor.fetchone()
-        if row is None:
-            return None
-        return cls._row_to_instance(db_path, row)
+        return cls._fetch_one(
+            cls._resolve_db_path(None), cls._sql["get_by_email"], (email,),
+            lambda cache: cache.get_alias("email", email),
+        )
 
     @classmethod
     def get_by_login(cls, login: str) -> Optional["User"]:
-        db_path = cls._resolve_db_path(None)
-        with cls._connect(db_path) as conn:
-            cursor = conn.execute(
-                f"SELECT * FROM {cls.table} WHERE username = ? OR email = ?",
-                (login, login),
-            )
-            row = cursor.fetchone()
-        if row is None:
-            return None
-        return cls._row_to_instance(db_path, row)
+        return cls._fetch_one(
+            cls._resolve_db_path(None), cls._sql["get_by_login"], (login, login),
+            lambda cache: cache.get_alias("username", login) or cache.get_alias("email", login),
+        )
 
 
 class Profile(_OrmBase):
@@ -323,6 +1117,7 @@ class Profile(_OrmBase):
         "hair_colour",
     ]
     model_cls = models.Profile
+    __slots__ = (pk_field, *columns)
 
 
 class Picture(_OrmBase):
@@ -330,6 +1125,7 @@ class Picture(_OrmBase):
     pk_field = "picture_id"
     columns = ["profile_id", "path"]
     model_cls = models.Picture
+    __slots__ = (pk_field, *columns)
 
 
 class Preference(_OrmBase):
@@ -337,6 +1133,7 @@ class Preference(_OrmBase):
     pk_field = "preference_id"
     columns = ["profile_id", "lower_age_bound", "upper_age_bound", "sexual_preference"]
     model_cls = models.Preference
+    __slots__ = (pk_field, *columns)
 
 
 class Hobby(_OrmBase):
@@ -344,3 +1141,61 @@ class Hobby(_OrmBase):
     pk_field = "hobby_id"
     columns = ["profile_id", "hobby_name"]
     model_cls = models.Hobby
+    __slots__ = (pk_field, *columns)
+
+
+class Swipe(_OrmBase):
+    table = "Swipe"
+    pk_field = "swipe_id"
+    columns = ["profile_id", "other_profile_id", "result", "created_at"]
+    model_cls = models.Swipe
+    __slots__ = (pk_field, *columns)
+
+    @classmethod
+    def record_many(
+        cls, db_path: Optional[str] = None, swipes: Iterable[tuple[int, int, str, int]] = ()
+    ) -> list[tuple[int, int]]:
+        """
+        Store (profile_id, other_profile_id, result, created_at) swipes in one
+        transaction; a repeated swipe replaces the earlier one. Returns the pairs
+        that are now mutual successes, each pair once.
+        """
+        db_path = cls._resolve_db_path(db_path)
+        swipes = list(swipes)
+        matches: dict[tuple[int, int], None] = {}
+        with cls._connect(db_path) as conn:
+            conn.executemany(
+                f"INSERT INTO {cls.table} (profile_id, other_profile_id, result, created_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (profile_id, other_profile_id) "
+                "DO UPDATE SET result = excluded.result, created_at = excluded.created_at",
+                swipes,
+            )
+            for profile_id, other_profile_id, result, _ in swipes:
+                pair = (min(profile_id, other_profile_id), max(profile_id, other_profile_id))
+                if result == "success" and pair not in matches and cls._is_mutual(conn, *pair):
+                    matches[pair] = None
+        return list(matches)
+
+    @classmethod
+    def swiped_ids(cls, db_path: Optional[str] = None, profile_id: int = 0) -> list[int]:
+        """Ids of the profiles profile_id has swiped, whatever the result"""
+        db_path = cls._resolve_db_path(db_path)
+        with cls._connect(db_path) as conn:
+            cursor = conn.execute(f"SELECT other_profile_id FROM {cls.table} WHERE profile_id = ?", (profile_id,))
+            return [row[0] for row in _tuples(cursor)]
+
+    @classmethod
+    def _is_mutual(cls, conn: sqlite3.Connection, profile_id: int, other_profile_id: int) -> bool:
+        # Two lookups on idx_swipe_pair
+        cursor = conn.execute(
+            f"SELECT COUNT(*) FROM {cls.table} WHERE result = 'success' AND "
+            "((profile_id = ? AND other_profile_id = ?) OR (profile_id = ? AND other_profile_id = ?))",
+            (profile_id, other_profile_id, other_profile_id, profile_id),
+        )
+        return cursor.fetchone()[0] == 2
+
+    @classmethod
+    def is_mutual(cls, profile_id: int, other_profile_id: int) -> bool:
+        db_path = cls._resolve_db_path(None)
+        with cls._connect(db_path) as conn:
+            return cls._is_mutual(conn, profile_id, other_profile_id)
@@ -0,0 +1,89 @@
+import threading
+from typing import Optional
+
+import numpy as np
+
+from tools import orm
+from tools.cache import LRUCache
+from tools.swipes import SwipeWriter
+
+
+class SeenFilter:
+    """
+    Per-profile bitmap of the profile ids it has already swiped (bit i set =
+    profile i was seen). A bitmap is loaded from the Swipe table on first use,
+    together with swipes still queued in ``writer``, kept up to date by mark()
+    and evicted least-recently-used once ``max_bytes`` is exceeded.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        writer: Optional[SwipeWriter] = None,
+        max_entries: int = 100_000,
+        max_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.db_path = db_path
+        self.writer = writer
+        self.bitmaps = LRUCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=lambda bits: bits.nbytes + 100)
+        # Loading and marking share one lock so a swipe can't slip between
+        # "bitmap not loaded yet" and "bitmap loaded without it"
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _set_bits(bits: np.ndarray, profile_ids: np.ndarray) -> np.ndarray:
+        if len(profile_ids):
+            # Negative indexes would set another profile's bit
+            if int(profile_ids.min()) < 1:
+                raise ValueError(f"Invalid profile id: {int(profile_ids.min())}")
+            needed = int(profile_ids.max()) // 8 + 1
+            if needed > len(bits):
+                grown = np.zeros(max(needed, 2 * len(bits)), dtype=np.uint8)
+                grown[:len(bits)] = bits
+                bits = grown
+            np.bitwise_or.at(bits, profile_ids >> 3, (1 << (profile_ids & 7)).astype(np.uint8))
+        return bits
+
+    def _load(self, profile_id: int) -> np.ndarray:
+        # Queued swipes first: whatever leaves the queue meanwhile is in the table
+        pending = [other for other, _ in self.writer.pending_for(profile_id)] if self.writer else []
+        swiped = np.array(orm.Swipe.swiped_ids(self.db_path, profile_id) + pending, dtype=np.int64)
+        return self._set_bits(np.zeros(0, dtype=np.uint8), swiped)
+
+    def bitmap(self, profile_id: int) -> np.ndarray:
+        bits = self.bitmaps.get(profile_id)
+        if bits is None:
+            with self._lock:
+                bits = self.bitmaps.get(profile_id)
+                if bits is None:
+                    bits = self._load(profile_id)
+                    self.bitmaps.set(profile_id, bits)
+        return bits
+
+    def mark(self, profile_id: int, other_profile_id: int) -> None:
+        """Record a swipe; bitmaps that are not loaded will pick it up when they are"""
+        if other_profile_id < 1:
+            raise ValueError(f"Invalid profile id: {other_profile_id}")
+        with self._lock:
+            bits = self.bitmaps.get(profile_id)
+            if bits is not None:
+                grown = self._set_bits(bits, np.array([other_profile_id], dtype=np.int64))
+                if grown is not bits:
+                    self.bitmaps.set(profile_id, grown)
+
+    def seen_mask(self, profile_id: int, other_profile_ids: np.ndarray) -> np.ndarray:
+        """Boolean mask: True where profile_id has already swiped the other profile"""
+        return self.bitmap_mask(self.bitmap(profile_id), other_profile_ids)
+
+    @staticmethod
+    def bitmap_mask(bits: np.ndarray, other_profile_ids: np.ndarray) -> np.ndarray:
+        """Boolean mask: True where the bit of the other profile is set in bits"""
+        other_profile_ids = np.asarray(other_profile_ids, dtype=np.int64)
+        inside = (other_profile_ids >= 0) & ((other_profile_ids >> 3) < len(bits))
+        mask = np.zeros(len(other_profile_ids), dtype=bool)
+        ids = other_profile_ids[inside]
+        mask[inside] = (bits[ids >> 3] >> (ids & 7)) & 1 == 1
+        return mask
+
+    def forget(self, profile_id: int) -> None:
+        self.bitmaps.pop(profile_id)
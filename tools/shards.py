@@ -0,0 +1,309 @@
+"""
+Sharded matcher: the index split across worker processes.
+
+Profiles belong to shard profile_id % shards. Every shard worker owns an
+Algorithm over its profiles only, so ranking runs on as many cores as there
+are shards. rank() sends the query profile to all shards, each ranks its own
+rows, and the per-shard top lists are merged. The parent process reads the
+change log and hands every shard the changed profiles it owns.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import traceback
+import typing
+from concurrent.futures import Future
+
+import numpy as np
+
+from tools import metrics
+from tools import models
+from tools import orm
+from tools.algo import Algorithm, RankedMatcher
+from tools.seen import SeenFilter
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a shard's answer once it is running
+REQUEST_TIMEOUT = 60.0
+
+
+class ShardError(RuntimeError):
+    """A shard worker failed or went away"""
+
+
+class _QuerySeen:
+    """SeenFilter stand-in inside a shard: the querying user's bitmap comes with the query"""
+
+    def __init__(self, profile_id: int, bits: np.ndarray) -> None:
+        self.profile_id = profile_id
+        self.bits = bits
+
+    def seen_mask(self, profile_id: int, other_profile_ids: np.ndarray) -> np.ndarray:
+        if profile_id != self.profile_id:
+            return np.zeros(len(other_profile_ids), dtype=bool)
+        return SeenFilter.bitmap_mask(self.bits, other_profile_ids)
+
+
+def _serve(conn: typing.Any, db_path: str, index: int, count: int, options: dict[str, typing.Any]) -> None:
+    """Shard worker: answers (request_id, method, args) messages until it receives None"""
+    db = orm.Database(db_path)
+    matcher = Algorithm(db, cache_size=0, shard=(index, count), **options)
+
+    def rank(
+        profile: models.FullProfile, limit: int, seen_bits: typing.Optional[np.ndarray], exhaustive: bool
+    ) -> tuple[np.ndarray, np.ndarray, bool]:
+        # Requests are handled one at a time, so the stand-in is never shared
+        matcher.seen = None if seen_bits is None else _QuerySeen(profile.profile_id, seen_bits)
+        try:
+            profile_ids, scores = matcher._rank_uncached(profile, limit, exhaustive)
+        finally:
+            matcher.seen = None
+        # Whether the query profile is indexed here; only its owner's answer counts
+        return profile_ids, scores, profile.profile_id is not None and matcher._is_indexed(profile.profile_id)
+
+    def apply(profile_ids: list[int], profiles: list[models.FullProfile], last_seq: typing.Optional[int]) -> None:
+        matcher.apply_profiles(profile_ids, profiles)
+        if last_seq is not None:
+            matcher.last_seq = max(matcher.last_seq, last_seq)
+            # Every shard reports the seq its index reached
+            matcher._report_progress()
+
+    def rebuild() -> int:
+        matcher._build_index()
+        matcher._report_progress()
+        return matcher.last_seq
+
+    handlers: dict[str, typing.Callable[..., typing.Any]] = {
+        "rank": rank,
+        "apply": apply,
+        "last_seq": lambda: matcher.last_seq,
+        "size": lambda: len(matcher.store.row_of),
+        "is_indexed": matcher._is_indexed,
+        "save_snapshot": matcher.save_snapshot,
+        "rebuild": rebuild,
+    }
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, method, args = message
+        try:
+            conn.send((request_id, True, handlers[method](*args)))
+        except Exception:
+            conn.send((request_id, False, traceback.format_exc()))
+    matcher.close()
+    db.close()
+
+
+class _Shard:
+    """Parent side of one shard worker; calls may come from any thread"""
+
+    def __init__(
+        self, context: typing.Any, index: int, count: int, db_path: str, options: dict[str, typing.Any]
+    ) -> None:
+        self.index = index
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child_conn, db_path, index, count, options), name=f"matcher-shard-{index}", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self._pending: dict[int, Future] = {}
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name=f"matcher-shard-{index}-reader", daemon=True)
+        self._reader.start()
+
+    def call(self, method: str, *args: typing.Any) -> Future:
+        """Send a request; the future resolves with the shard's answer"""
+        future: Future = Future()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self.conn.send((request_id, method, args))
+            except (OSError, ValueError) as e:
+                del self._pending[request_id]
+                raise ShardError(f"Shard {self.index} is not running") from e
+        return future
+
+    def _read(self) -> None:
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(ShardError(f"Shard {self.index} failed:\n{result}"))
+        # Worker gone: nobody will answer the requests still waiting
+        with self._send_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ShardError(f"Shard {self.index} exited"))
+
+    def close(self) -> None:
+        with self._send_lock:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class ShardedMatcher(RankedMatcher):
+    """
+    Drop-in for Algorithm with the index spread over ``shards`` worker
+    processes (default: one per CPU core). Remaining keyword arguments
+    configure the Algorithm of every shard. With a snapshot_path every shard
+    keeps its own snapshot next to it.
+    """
+
+    def __init__(
+        self,
+        db: orm.Database,
+        shards: typing.Optional[int] = None,
+        cache_size: int = 10_000,
+        cache_ttl: typing.Optional[float] = 300.0,
+        cache_max_bytes: typing.Optional[int] = 64 * 1024 * 1024,
+        snapshot_path: typing.Optional[str] = None,
+        seen: typing.Optional[SeenFilter] = None,
+        **index_options: typing.Any,
+    ) -> None:
+        super().__init__(db, cache_size, cache_ttl, cache_max_bytes, snapshot_path, seen)
+        count = shards or os.cpu_count() or 1
+        # spawn, as in Algorithm._build_index_parallel
+        context = multiprocessing.get_context("spawn")
+        self.shards = [
+            _Shard(context, index, count, db.path, {
+                **index_options,
+                "snapshot_path": self._shard_snapshot_path(snapshot_path, index, count) if snapshot_path else None,
+            })
+            for index in range(count)
+        ]
+        # Waits for every shard to finish building; changes logged after the
+        # oldest shard read the tables are applied again by sync()
+        self.last_seq = min(future.result() for future in self._call_all("last_seq"))
+
+    @staticmethod
+    def _shard_snapshot_path(path: str, index: int, count: int) -> str:
+        return f"{path}.{index}-of-{count}"
+
+    def _call_all(self, method: str, *args: typing.Any) -> list[Future]:
+        return [shard.call(method, *args) for shard in self.shards]
+
+    def _shard_of(self, profile_id: int) -> _Shard:
+        return self.shards[profile_id % len(self.shards)]
+
+    def _is_indexed(self, profile_id: int) -> bool:
+        # Only the owning shard knows; rank() gets the answer with the ranking instead
+        return self._shard_of(profile_id).call("is_indexed", profile_id).result(REQUEST_TIMEOUT)
+
+    def _rank_cacheable(self, profile_id: int, limit: int) -> tuple[np.ndarray, np.ndarray, bool]:
+        return self._rank_shards(profile_id, limit)
+
+    def _rank_uncached(
+        self, profile: models.FullProfile | str | int, limit: int, exhaustive: bool = False
+    ) -> tuple[np.ndarray, np.ndarray]:
+        profile_ids, scores, _ = self._rank_shards(profile, limit, exhaustive)
+        return profile_ids, scores
+
+    def _rank_shards(
+        self, profile: models.FullProfile | str | int, limit: int, exhaustive: bool = False
+    ) -> tuple[np.ndarray, np.ndarray, bool]:
+        """Merged ranking of all shards, and whether the owning shard indexes the profile"""
+        loaded = self._load_profile(profile)
+        if loaded is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), False
+        seen_bits = None
+        if self.seen is not None and loaded.profile_id is not None:
+            seen_bits = self.seen.bitmap(loaded.profile_id)
+
+        with metrics.MATCHER_PHASE.time("shards"):
+            futures = self._call_all("rank", loaded, limit, seen_bits, exhaustive)
+            parts = [future.result(REQUEST_TIMEOUT) for future in futures]
+        profile_ids = np.concatenate([part[0] for part in parts])
+        scores = np.concatenate([part[1] for part in parts])
+        indexed = loaded.profile_id is not None and parts[loaded.profile_id % len(parts)][2]
+        # Best first; equal scores in profile id order
+        top = np.lexsort((profile_ids, -scores))[:limit]
+        return profile_ids[top], scores[top], indexed
+
+    def regenerate_preferences(self, profile: models.FullProfile | str | int) -> None:
+        """
+        Re-index one profile on its shard
+
+        :param profile: FullProfile object or profile_id
+        :raises ValueError: If profile not found
+        """
+        loaded = self._load_profile(profile)
+        if not loaded:
+            raise ValueError(f"Profile not found: {profile}")
+        self._shard_of(loaded.profile_id).call("apply", [loaded.profile_id], [loaded], None).result(REQUEST_TIMEOUT)
+        self.invalidate(loaded.profile_id)
+
+    def sync(self, batch_size: int = 10_000) -> int:
+        """
+        Send the profiles changed since last_seq to the shards owning them.
+        Returns the number of profiles applied; if the log was pruned past
+        last_seq every shard rebuilds and the result counts all profiles.
+        """
+        applied = 0
+        count = len(self.shards)
+        with self._sync_lock:
+            if self._missed_changes(self.last_seq):
+                logger.warning("Change log pruned past seq %s, rebuilding all shards", self.last_seq)
+                self.last_seq = min(future.result() for future in self._call_all("rebuild"))
+                self.match_cache.clear()
+                applied = self.size()
+            while True:
+                last_seq, profile_ids = self.db.profile_changes(self.last_seq, batch_size)
+                if not profile_ids:
+                    return applied
+                profiles = self.db.get_profiles(profile_ids)
+                futures = [
+                    shard.call(
+                        "apply",
+                        [profile_id for profile_id in profile_ids if profile_id % count == shard.index],
+                        [profile for profile in profiles if profile.profile_id % count == shard.index],
+                        last_seq,
+                    )
+                    for shard in self.shards
+                ]
+                for future in futures:
+                    future.result(REQUEST_TIMEOUT)
+                for profile_id in profile_ids:
+                    self.invalidate(profile_id)
+                self.last_seq = last_seq
+                applied += len(profile_ids)
+
+    def save_snapshot(self, path: str) -> None:
+        """Every shard writes its own snapshot next to path"""
+        with self._sync_lock:
+            count = len(self.shards)
+            futures = [
+                shard.call("save_snapshot", self._shard_snapshot_path(path, shard.index, count))
+                for shard in self.shards
+            ]
+            for future in futures:
+                future.result(REQUEST_TIMEOUT)
+
+    def size(self) -> int:
+        """Profiles indexed over all shards"""
+        return sum(future.result(REQUEST_TIMEOUT) for future in self._call_all("size"))
+
+    def close(self) -> None:
+        self.stop_sync()
+        for shard in self.shards:
+            shard.close()
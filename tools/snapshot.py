@@ -0,0 +1,78 @@
+"""
+Single-file, memory-mappable array snapshots.
+
+Layout: 8 byte magic, 8 byte little-endian header length, a JSON header, then
+every array at a 64 byte aligned offset. Arrays are opened with np.memmap in
+copy-on-write mode, so processes reading the same snapshot share its pages
+until they modify a row.
+"""
+import json
+import os
+import struct
+import typing
+
+import numpy as np
+
+MAGIC = b"STSNAP01"
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path: str, arrays: dict[str, np.ndarray], meta: dict[str, typing.Any]) -> None:
+    """Write arrays and meta to path atomically (readers never see a partial file)"""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    header = b""
+    # The header size depends on the offsets and vice versa; grow until stable
+    data_start = ALIGNMENT
+    while True:
+        offset = data_start
+        for name, array in arrays.items():
+            layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({"meta": meta, "arrays": layout}).encode()
+        needed = _aligned(len(MAGIC) + 8 + len(header))
+        if needed <= data_start:
+            break
+        data_start = needed
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_header(path: str) -> dict[str, typing.Any]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a snapshot file: {path}")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(header_length))
+
+
+def read_meta(path: str) -> dict[str, typing.Any]:
+    """Only the meta dict, without mapping any arrays"""
+    return _read_header(path)["meta"]
+
+
+def read_snapshot(path: str) -> tuple[dict[str, typing.Any], dict[str, np.ndarray]]:
+    """Return (meta, arrays); arrays are copy-on-write memory maps"""
+    header = _read_header(path)
+    arrays = {}
+    for name, info in header["arrays"].items():
+        shape = tuple(info["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=info["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype=info["dtype"], mode="c", offset=info["offset"], shape=shape)
+    return header["meta"], arrays
@@ -0,0 +1,156 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from tools import orm
+
+logger = logging.getLogger(__name__)
+
+
+class SwipeWriter:
+    """
+    Write-behind queue for swipes.
+
+    submit() only appends to an in-memory queue and returns immediately. A
+    background thread writes the queue in batches, one transaction per batch,
+    at most ``max_delay`` seconds after a swipe arrived (sooner once
+    ``batch_size`` swipes are waiting). close() - also run at interpreter
+    exit - writes whatever is left. ``on_match`` is called from the writer
+    thread with (profile_id, other_profile_id) for every new mutual success.
+
+    A swipe the database refuses (an unknown or deleted profile) is logged and
+    kept in ``rejected`` instead of being retried, so it cannot hold up the
+    swipes queued after it. Other errors put the batch back and retry it.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        batch_size: int = 500,
+        max_delay: float = 0.2,
+        on_match: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.on_match = on_match
+        # (profile_id, other_profile_id, result, created_at)
+        self._queue: deque[tuple[int, int, str, int]] = deque()
+        self._first_queued_at: Optional[float] = None
+        # Swipes dropped because of an IntegrityError, with the error, newest last
+        self.rejected: deque[tuple[tuple[int, int, str, int], str]] = deque(maxlen=1000)
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="swipe-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, profile_id: int, other_profile_id: int, result: str) -> None:
+        if result not in ("success", "denial"):
+            raise ValueError(f"Invalid result: {result}")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SwipeWriter is closed.")
+            was_empty = not self._queue
+            if was_empty:
+                self._first_queued_at = time.monotonic()
+            self._queue.append((profile_id, other_profile_id, result, int(time.time())))
+            # The writer waits without a deadline while the queue is empty
+            if was_empty or len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def pending_for(self, profile_id: int) -> list[tuple[int, str]]:
+        """(other_profile_id, result) of swipes by profile_id that are not written yet"""
+        with self._cond:
+            return [(other, result) for owner, other, result, _ in self._queue if owner == profile_id]
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def _take_batch(self) -> list[tuple[int, int, str, int]]:
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        self._first_queued_at = time.monotonic() if self._queue else None
+        return batch
+
+    def _write_next(self) -> bool:
+        """Write the next batch; returns False if the queue was empty"""
+        # Taking and writing under one lock keeps batches in submit order
+        with self._write_lock:
+            with self._cond:
+                if not self._queue:
+                    return False
+                batch = self._take_batch()
+            try:
+                matches = orm.Swipe.record_many(self.db_path, batch)
+            except sqlite3.IntegrityError:
+                # The batch was rolled back; find the refused rows one by one
+                matches = self._write_each(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+        if self.on_match is not None:
+            for profile_id, other_profile_id in matches:
+                try:
+                    self.on_match(profile_id, other_profile_id)
+                except Exception:
+                    logger.exception("on_match failed for %s/%s", profile_id, other_profile_id)
+        return True
+
+    def _requeue(self, swipes: list[tuple[int, int, str, int]]) -> None:
+        with self._cond:
+            self._queue.extendleft(reversed(swipes))
+            self._first_queued_at = time.monotonic()
+
+    def _write_each(self, batch: list[tuple[int, int, str, int]]) -> list[tuple[int, int]]:
+        matches = []
+        for index, swipe in enumerate(batch):
+            try:
+                matches.extend(orm.Swipe.record_many(self.db_path, [swipe]))
+            except sqlite3.IntegrityError as e:
+                logger.warning("Dropping swipe %s: %s", swipe, e)
+                self.rejected.append((swipe, str(e)))
+            except Exception:
+                self._requeue(batch[index:])
+                raise
+        return matches
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._queue) >= self.batch_size:
+                        break
+                    if self._queue:
+                        remaining = self._first_queued_at + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            try:
+                self._write_next()
+            except Exception:
+                logger.exception("Writing swipes failed, retrying in %ss", self.max_delay)
+                time.sleep(self.max_delay)
+
+    def flush(self) -> None:
+        """Write everything queued so far, in the calling thread"""
+        while self._write_next():
+            pass
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)